@@ -7,41 +7,206 @@
 #   • EE Global water occurrence    JRC/GSW1_4/GlobalSurfaceWater
 #   • EE Global tidal range raster  users/<YOU>/global_tidal_range
 # ---------------------------------------------------------------------
+import hashlib
+import logging
+import os
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import ee
 from ee.batch import Export
+from .filter import add_chla_median, add_wind_speed, lt_or_missing
 from .tide import tide_ok
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------------------------------------------------
-MAX_ACTIVE = 250     # leave headroom under EE’s 300-task limit
+# Leave headroom under EE’s 300-task limit.  The pipeline initialises EE
+# on the high-volume endpoint (utils.gee_utils.HIGH_VOLUME_URL), which has
+# higher concurrent-compute quotas – raise via MHP_MAX_ACTIVE if your
+# project's batch quota allows it.
+MAX_ACTIVE = int(os.getenv("MHP_MAX_ACTIVE", 250))
+
+REFRESH_S  = 60      # how often the local task count is re-synced with EE
+MAX_WORKERS = min(32, max(4, MAX_ACTIVE // 8))   # concurrent tile submissions
+
+GSW_ASSET = "JRC/GSW1_4/GlobalSurfaceWater"
+
+_active_tasks: set[str] = set()   # IDs of READY / RUNNING tasks
+_last_refresh: float = 0.0
+_lock = threading.Lock()          # guards the two globals above
+
+
+def _refresh_active():
+    """Re-sync _active_tasks with the operations EE still has in flight."""
+    global _last_refresh
+    ops = ee.data.listOperations()
+    _active_tasks.clear()
+    _active_tasks.update(
+        op["name"].rsplit("/", 1)[-1] for op in ops if not op.get("done")
+    )
+    _last_refresh = time.time()
+
 
 def _throttle():
-    while len(ee.data.getTaskList()) >= MAX_ACTIVE:
-        print("GEE task queue full — sleeping 60 s …")
-        time.sleep(60)
+    # One thread refreshes / sleeps at a time; the others queue on the lock
+    # instead of all hitting listOperations() at once.
+    with _lock:
+        if time.time() - _last_refresh >= REFRESH_S:
+            _refresh_active()
+        while len(_active_tasks) >= MAX_ACTIVE:
+            logger.warning("GEE task queue full — sleeping 60 s …")
+            time.sleep(60)
+            _refresh_active()
 
-# ---------------------------------------------------------------------
-def process_tile_cloud(tile_geom, tile_id, config):
+
+POLL_S = 30          # task-status poll interval for persisted intermediates
+RETRIES = 5          # attempts per tile when EE reports throttling
+
+_THROTTLED = ("Too many", "rate limit", "quota", "429")
+
+
+MISSING_ROUNDS = 3   # polls an asset task may be unlisted before giving up
+
+
+def _operations():
+    """{task_id: operation} for the project, from one listOperations() call."""
+    return {op["name"].rsplit("/", 1)[-1]: op for op in ee.data.listOperations()}
+
+
+def _wait_for(task_id):
+    """Block until EE task `task_id` completes; raise if it fails."""
+    missing = 0
+    while True:
+        op = _operations().get(task_id)
+        if op is None:
+            missing += 1
+            if missing >= MISSING_ROUNDS:
+                raise RuntimeError(f"EE task {task_id} not found")
+        elif op.get("done"):
+            if "error" in op:
+                raise RuntimeError(
+                    f"EE task {task_id} "
+                    f"{op.get('metadata', {}).get('state', 'FAILED')}: "
+                    f"{op['error'].get('message', '')}"
+                )
+            return
+        time.sleep(POLL_S)
+
+
+_folder_lock = threading.Lock()       # first-use folder resolution only
+_persisting: dict[str, str] = {}      # asset id → toAsset task ID (this run)
+
+
+@lru_cache(maxsize=8)
+def _resolve_asset_folder(folder):
+    """Resolve (and create if missing) the intermediate-asset folder once."""
+    if not folder:
+        roots = ee.data.getAssetRoots()
+        if not roots:
+            raise RuntimeError(
+                "persist_intermediate needs an EE asset folder: this account has "
+                "no asset roots – create one or set gee_asset_folder in the config."
+            )
+        folder = f"{roots[0]['id']}/clearwater_intermediate"
+    try:
+        ee.data.getAsset(folder)
+    except ee.EEException:
+        ee.data.createAsset({"type": "FOLDER"}, folder)
+    return folder
+
+
+def _asset_folder(config):
+    # Own lock, not _lock: only concurrent *first* calls wait on the RPCs,
+    # later ones are a cache hit and never hold up _throttle()
+    with _folder_lock:
+        return _resolve_asset_folder(config.get("gee_asset_folder"))
+
+
+def _persist(image, aoi_ee, tile_id, config):
     """
-    Build the clear-water composite for one tile entirely in Earth Engine.
+    Start materialising `image` as an EE asset and return
+    (ee.Image(asset_id), task_id) – task_id is None when a previous run
+    already stored the same composite.  Later exports then read the
+    stored pixels instead of recomputing the whole composite graph.
 
-    Args
-    ----
-    tile_geom : shapely geometry (EPSG:4326) of the tile
-    tile_id   : unique string ID
-    config    : dict with at least
-        start_date, end_date
-        cloud_thresh, chla_thresh, wind_thresh, tidal_thresh_m
-        max_scenes, water_occurrence_thresh
-        gee_bucket, gee_folder, gee_scale
+    The asset id carries a short hash of the serialised composite graph
+    (dates, thresholds, scenes, bands …) and the export scale, so a rerun
+    with different settings never reuses a stale asset.
+    """
+    scale = config.get("gee_scale", 10)
+    digest = hashlib.blake2b(
+        f"{image.serialize()}|{scale}".encode(), digest_size=5
+    ).hexdigest()
+    folder = _asset_folder(config)
+    asset_id = f"{folder}/{tile_id}_{digest}"
+    with _lock:
+        running = _persisting.get(asset_id)
+    if running is not None:       # retry of a tile whose toAsset already started
+        return ee.Image(asset_id), running
+    try:
+        ee.data.getAsset(asset_id)
+        return ee.Image(asset_id), None
+    except ee.EEException:
+        pass
 
-    Returns
-    -------
-    str  Earth Engine task ID
+    _throttle()
+    task = Export.image.toAsset(
+        image       = image,
+        description = f"clearwater_asset_{tile_id}",
+        assetId     = asset_id,
+        region      = aoi_ee,
+        scale       = scale,
+        crs         = "EPSG:4326",
+        maxPixels   = 1e13,
+    )
+    task.start()
+    with _lock:
+        _active_tasks.add(task.id)
+        _persisting[asset_id] = task.id
+    logger.info("Persisting intermediate for %s → %s", tile_id, asset_id)
+    return ee.Image(asset_id), task.id
+
+
+@lru_cache(maxsize=8)
+def _water_mask(thresh):
+    """GSW occurrence ≥ thresh %, built once per threshold (needs EE init)."""
+    return ee.Image(GSW_ASSET).select("occurrence").gte(thresh)
+
+def _output_prefix(tile_id, config):
+    return f"{config.get('gee_folder', 'clearwater')}/{tile_id}"
+
+
+# EE writes <prefix>.tif, or <prefix>-<row>-<col>.tif for large tiles
+_COG_SUFFIX = re.compile(r"(-\d+-\d+)?\.tif$")
+
+
+def existing_outputs(config):
     """
-    # 1) AOI ➜ EE geometry
-    aoi_ee = ee.Geometry(tile_geom.__geo_interface__)
+    Output prefixes (blob names minus the .tif / -<row>-<col>.tif suffix)
+    already under gee_bucket/gee_folder – one LIST request instead of a
+    HEAD per tile, and an O(1) lookup per tile afterwards.
+    """
+    from google.cloud import storage      # lazy: only needed in cloud mode
+
+    client = storage.Client()
+    prefix = f"{config.get('gee_folder', 'clearwater')}/"
+    return {
+        _COG_SUFFIX.sub("", b.name)
+        for b in client.list_blobs(config["gee_bucket"], prefix=prefix)
+        if b.name.endswith(".tif")
+    }
+
+
+def _already_exported(prefix, existing):
+    return prefix in existing
 
+# ---------------------------------------------------------------------
+def _scene_collection(aoi_ee, config):
+    """Sentinel-2 scenes for one tile after cloud / tide / CHL-a / wind."""
     # 2) Sentinel-2 collection with cloud + tide filters
     coll = (
         ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
@@ -53,89 +218,107 @@ def process_tile_cloud(tile_geom, tile_id, config):
 
     # 3) CHL-a median per scene (JAXA GCOM-C V3, 8-day)
     if config.get("chla_thresh") is not None:
-        chla_src = (
-            ee.ImageCollection("JAXA/GCOM-C/L3/OCEAN/CHLA/V3")
-            .filterDate(config["start_date"], config["end_date"])
-        )
-
-        def add_chla(img):
-            d   = ee.Date(img.get("system:time_start"))
-            day = chla_src.filterDate(d, d.advance(1, "day")).median()
-
-            band = ee.String(
-                ee.Algorithms.If(
-                    day.bandNames().contains("CHLA_AVE"),
-                    "CHLA_AVE",
-                    "chlor_a",
-                )
-            )
-
-            median = day.select(band).reduceRegion(
-                reducer   = ee.Reducer.median(),
-                geometry  = aoi_ee,
-                scale     = 4_500,            # native ≈ 4.6 km
-                bestEffort=True,
-            ).get(band)
-
-            return img.set("CHLA_MEDIAN", median)
-
         coll = (
-            coll.map(add_chla)
-            .filter(ee.Filter.lt("CHLA_MEDIAN", config["chla_thresh"]))
+            add_chla_median(coll, aoi_ee, config["start_date"], config["end_date"])
+            .filter(lt_or_missing("CHLA_MEDIAN", config["chla_thresh"]))
         )
 
     # 4) Wind filter (ERA5 hourly, 10 m)
     if config.get("wind_thresh") is not None:
-        era5 = (
-            ee.ImageCollection("ECMWF/ERA5/HOURLY")
-            .filterDate(config["start_date"], config["end_date"])
-            .select(["u_component_of_wind_10m", "v_component_of_wind_10m"])
+        coll = (
+            add_wind_speed(coll, aoi_ee, config["start_date"], config["end_date"])
+            .filter(lt_or_missing("WIND_SPEED", config["wind_thresh"]))
         )
 
-        def add_wind(img):
-            t = ee.Date(img.get("system:time_start"))
-            wind = (
-                era5.filterDate(t.advance(-3, "hour"), t.advance(3, "hour"))
-                .median()
-            )
-            speed = wind.expression(
-                "sqrt(u*u + v*v)",
-                {
-                    "u": wind.select("u_component_of_wind_10m"),
-                    "v": wind.select("v_component_of_wind_10m"),
-                },
-            ).rename("wind")
+    # 5) Cap number of scenes
+    return coll.limit(config.get("max_scenes", 50))
 
-            mean = speed.reduceRegion(
-                ee.Reducer.mean(), aoi_ee, scale=25_000, bestEffort=True
-            ).get("wind")
 
-            return img.set("WIND_SPEED", mean)
+def process_tile_cloud(tile_geom, tile_id, config, scenes=None, existing=None,
+                       deferred=None):
+    """
+    Build the clear-water composite for one tile entirely in Earth Engine.
 
+    Args
+    ----
+    tile_geom : shapely geometry (EPSG:4326) of the tile
+    tile_id   : unique string ID
+    config    : dict with at least
+        start_date, end_date
+        cloud_thresh, chla_thresh, wind_thresh, tidal_thresh_m
+        max_scenes, water_occurrence_thresh
+        gee_bucket, gee_folder, gee_scale
+      optional
+        persist_intermediate  – export the composite to an EE asset first
+                                (gee_asset_folder, default
+                                <asset root>/clearwater_intermediate) and
+                                export the COG from that asset
+    scenes    : optional pre-filtered scenes – an ee.ImageCollection (e.g.
+                filter_scenes(..., lazy=True)) used as-is, or a list of S2
+                system:index IDs / filter_scenes records.  When None the
+                scenes are filtered here from `config`.
+    existing  : optional set of output prefixes (see existing_outputs); the
+                tile is skipped if its COG is already in the bucket.
+    deferred  : optional dict; with persist_intermediate, a tile whose asset
+                is still being built is recorded here as
+                {asset_task_id: (asset_image, aoi_ee, tile_id)} and None is
+                returned instead of blocking until the asset is done (see
+                process_tiles_cloud).
+
+    Returns
+    -------
+    str  Earth Engine task ID, or None if the output already exists (or
+         the export was deferred)
+    """
+    prefix = _output_prefix(tile_id, config)
+    if existing is not None and _already_exported(prefix, existing):
+        logger.info("Skipping %s: output already in gs://%s", tile_id, config["gee_bucket"])
+        return None
+
+    # 1) AOI ➜ EE geometry
+    aoi_ee = ee.Geometry(tile_geom.__geo_interface__)
+
+    # 2–5) Scene selection
+    if scenes is None:
+        coll = _scene_collection(aoi_ee, config)
+    elif isinstance(scenes, ee.ImageCollection):
+        coll = scenes
+    else:
+        ids  = [s["id"] if isinstance(s, dict) else s for s in scenes]
         coll = (
-            coll.map(add_wind)
-            .filter(ee.Filter.lt("WIND_SPEED", config["wind_thresh"]))
+            ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
+            .filter(ee.Filter.inList("system:index", ids))
         )
 
-    # 5) Cap number of scenes
-    coll = coll.limit(config.get("max_scenes", 50))
-
     # 6) Water-occurrence mask  (keep pixels ≥ threshold %)
-    water = ee.Image("JRC/GSW1_4/GlobalSurfaceWater").select("occurrence")
-    thresh = config.get("water_occurrence_thresh", 80)
-    wmask  = water.gte(thresh)
-    coll   = coll.map(lambda img: img.updateMask(wmask))
+    wmask = _water_mask(config.get("water_occurrence_thresh", 80))
+
+    # 7) Median composite – clip the scenes first so the reducer only sees
+    #    pixels inside the tile; the water mask is pixel-wise and identical
+    #    for every scene, so apply it once to the result.
+    coll   = coll.map(lambda img: img.clip(aoi_ee))
+    mosaic = coll.median().updateMask(wmask)
+    if config.get("persist_intermediate"):
+        mosaic, asset_task = _persist(mosaic, aoi_ee, tile_id, config)
+        if asset_task is not None:
+            if deferred is not None:    # caller exports once the asset exists
+                with _lock:
+                    deferred[asset_task] = (mosaic, aoi_ee, tile_id)
+                return None
+            _wait_for(asset_task)
+
+    return _export_cog(mosaic, aoi_ee, tile_id, config)
 
-    # 7) Median composite
-    mosaic = coll.median().clip(aoi_ee)
 
-    # 8) Export COG ➜ GCS
+def _export_cog(mosaic, aoi_ee, tile_id, config):
+    """8) Export COG ➜ GCS; returns the EE task ID."""
+    prefix = _output_prefix(tile_id, config)
     _throttle()     # be polite before adding a new task
     task = Export.image.toCloudStorage(
         image        = mosaic,
         description  = f"clearwater_{tile_id}",
         bucket       = config["gee_bucket"],
-        fileNamePrefix = f"{config.get('gee_folder', 'clearwater')}/{tile_id}",
+        fileNamePrefix = prefix,
         region       = aoi_ee,
         scale        = config.get("gee_scale", 10),
         crs          = "EPSG:4326",
@@ -144,6 +327,96 @@ def process_tile_cloud(tile_geom, tile_id, config):
         formatOptions= {"cloudOptimized": True},
     )
     task.start()
-    print(f"Started export for {tile_id}: task ID = {task.id}")
+    with _lock:
+        _active_tasks.add(task.id)
+    logger.info("Started export for %s: task ID = %s", tile_id, task.id)
     return task.id
+
+
+def _with_retry(tid, fn, *args, **kwargs):
+    """fn(*args, **kwargs) with backoff on throttling; None on failure."""
+    for attempt in range(RETRIES):
+        try:
+            return fn(*args, **kwargs)
+        except ee.EEException as e:
+            if attempt + 1 < RETRIES and any(t in str(e) for t in _THROTTLED):
+                delay = 2 ** attempt * 5
+                logger.warning("EE throttled %s — retrying in %s s …", tid, delay)
+                time.sleep(delay)
+                continue
+            logger.error("❌ Export failed for %s: %s", tid, e)
+            return None
+        except Exception as e:        # one bad tile must not sink the batch
+            logger.exception("❌ Export failed for %s: %s", tid, e)
+            return None
+
+
+def _export_persisted(deferred, config):
+    """
+    Wait for the deferred intermediate-asset tasks with one listOperations()
+    call per POLL_S round (not one thread blocked per tile), and start each
+    tile's COG export as soon as its asset is done.
+    Returns {tile_id: export task ID or None}.
+    """
+    pending, missing, out = dict(deferred), dict.fromkeys(deferred, 0), {}
+    while pending:
+        ops = _operations()
+        for task_id, (image, aoi_ee, tile_id) in list(pending.items()):
+            op = ops.get(task_id)
+            if op is None:
+                missing[task_id] += 1
+                if missing[task_id] < MISSING_ROUNDS:
+                    continue
+                op = {"done": True, "error": {"message": "task not found"}}
+            if not op.get("done"):
+                continue
+            del pending[task_id]
+            if "error" in op:
+                logger.error("❌ Intermediate asset failed for %s: %s",
+                             tile_id, op["error"].get("message", ""))
+                out[tile_id] = None
+            else:
+                out[tile_id] = _with_retry(tile_id, _export_cog,
+                                           image, aoi_ee, tile_id, config)
+        if pending:
+            logger.info("Waiting on %d intermediate asset(s) …", len(pending))
+            time.sleep(POLL_S)
+    return out
+
+
+def process_tiles_cloud(tiles, config, max_workers=MAX_WORKERS):
+    """
+    Run process_tile_cloud for every (tile_geom, tile_id) in `tiles` on a
+    thread pool – each call is dominated by EE round-trips, not CPU.
+    The bucket is listed once up front so finished tiles are never re-queued
+    (if listing fails the skip is simply disabled).
+    With persist_intermediate, tiles whose asset is still being built are
+    exported afterwards by a single poller (see _export_persisted), so no
+    worker sits blocked on an asset task.
+
+    Throttled submissions are retried with exponential backoff; a tile
+    that still fails is reported and yields None instead of aborting the
+    rest of the batch.
+
+    Returns the task IDs (None for skipped / failed tiles) in the same
+    order as `tiles`.
+    """
+    try:
+        existing = existing_outputs(config)
+    except Exception as e:   # no google-cloud-storage / ADC, or not a bucket
+        logger.warning("⚠ Could not list existing outputs in %s (%s) — "
+                       "exporting every tile", config.get("gee_bucket"), e)
+        existing = set()
+    deferred = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures = [
+            ex.submit(_with_retry, tid, process_tile_cloud, geom, tid, config,
+                      existing=existing, deferred=deferred)
+            for geom, tid in tiles
+        ]
+        results = [f.result() for f in futures]
+    if deferred:
+        late = _export_persisted(deferred, config)
+        results = [late.get(tid, r) for r, (_, tid) in zip(results, tiles)]
+    return results
 # ---------------------------------------------------------------------
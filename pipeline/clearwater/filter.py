@@ -7,30 +7,200 @@
 # • ERA5 1-hourly reanalysis         ECMWF/ERA5/HOURLY
 # • Global tidal-range raster        users/<YOU>/global_tidal_range
 # ---------------------------------------------------------------------
+import hashlib
+import json
+import logging
+import time
+from functools import lru_cache
+
 import ee
+import pandas as pd
+import pyproj
+from shapely.ops import transform as _shp_transform
+from ..common.autodata import CACHE
 from .tide import tide_ok          # <-- new
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------------------------------------------------
-_FILL = -9999          # placeholder for “null” values returned by EE
+_HOUR_MS = 3_600_000
+_DAY_MS  = 24 * _HOUR_MS
+_SIMPLIFY_DEG = 0.001  # ≈100 m – AOI tolerance for server-side reductions
+_CACHE_TTL_S  = 24 * 3600   # EE catalog updates daily
+
+# scene-dict key → S2 image property shipped back to Python
+_SCENE_PROPS = {
+    "id":    "system:index",
+    "date":  "system:time_start",
+    "cloud": "CLOUDY_PIXEL_PERCENTAGE",
+    "chla":  "CHLA_MEDIAN",
+    "wind":  "WIND_SPEED",
+}
+
+
+def lt_or_missing(prop, thresh):
+    """
+    Filter: `prop` < thresh, or `prop` is null (no CHL-a / wind data for
+    the scene – keep it rather than silently dropping it).
+    """
+    return ee.Filter.Or(
+        ee.Filter.lt(prop, thresh),
+        ee.Filter.notNull([prop]).Not(),
+    )
+
+
+def _within(field, max_ms):
+    """Join filter: left/right `field` timestamps differ by at most max_ms."""
+    return ee.Filter.maxDifference(
+        difference=max_ms, leftField=field, rightField=field,
+    )
 
 
-def _safe_set(val):
-    """Return ee.Number(val) or the _FILL sentinel if val is null."""
-    return ee.Algorithms.If(
-        ee.Algorithms.IsEqual(val, None),
-        ee.Number(_FILL),
-        val,
+def _chla_collection(start_date, end_date):
+    """JAXA GCOM-C V3 CHL-a images between start_date and end_date."""
+    return (
+        ee.ImageCollection("JAXA/GCOM-C/L3/OCEAN/CHLA/V3")
+        .filterDate(start_date, end_date)
     )
 
 
-def _to_python(val):
-    """Convert EE placeholder back to Python None."""
-    return None if val in (_FILL, None) else val
+@lru_cache(maxsize=32)
+def _chla_band(start_date, end_date):
+    """
+    Resolve the CHL-a band name once per date range ('CHLA_AVE' for
+    GCOM-C, 'chlor_a' otherwise) instead of branching per mapped scene.
+    """
+    chla_coll = _chla_collection(start_date, end_date)
+    has_ave = ee.Algorithms.If(
+        chla_coll.size().gt(0),
+        ee.Image(chla_coll.first()).bandNames().contains("CHLA_AVE"),
+        True,
+    ).getInfo()
+    return "CHLA_AVE" if has_ave else "chlor_a"
+
+
+def _cache_path(region, *params):
+    """Cache file for (AOI geometry, filter params) – SHA-256 keyed."""
+    h = hashlib.sha256(region.wkb)
+    h.update(repr(params).encode())
+    return CACHE / "scenes" / f"{h.hexdigest()}.json"
+
+
+def _cache_load(path):
+    """Return cached scenes if `path` is younger than _CACHE_TTL_S, else None."""
+    try:
+        if time.time() - path.stat().st_mtime < _CACHE_TTL_S:
+            return json.loads(path.read_text())
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _cache_store(path, scenes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(scenes))
+    tmp.replace(path)
+
+# ---------------------------------------------------------------------
+# Per-scene CHL-a / wind lookups  (shared with cloud_runner)
+# ---------------------------------------------------------------------
+def add_chla_median(coll, region, start_date, end_date):
+    """
+    Set CHLA_MEDIAN (median CHL-a over `region`, ±1 day) on every image.
+
+    Matching CHL-a images are attached to each scene by one server-side
+    join, so the CHL-a collection is never re-filtered inside the map.
+    """
+    chla_coll = _chla_collection(start_date, end_date)
+    coll = ee.ImageCollection(
+        ee.Join.saveAll(matchesKey="CHLA_MATCHES", outer=True).apply(
+            coll, chla_coll, _within("system:time_start", _DAY_MS),
+        )
+    )
+    band = _chla_band(start_date, end_date)
+
+    def add_chla(img):
+        day = ee.ImageCollection.fromImages(img.get("CHLA_MATCHES")).median()
+
+        median = day.select(band).reduceRegion(
+            reducer   = ee.Reducer.median(),
+            geometry  = region,
+            scale     = 4_500,          # native ≈4.6 km
+            bestEffort=True,
+        ).get(band)
+
+        return img.set("CHLA_MEDIAN", median)
+
+    return coll.map(add_chla)
+
+
+def add_wind_speed(coll, region, start_date, end_date):
+    """
+    Set WIND_SPEED (mean ERA5 10 m wind over `region`, median of the
+    hourly frames within ±3 h) on every image, via one server-side join.
+    """
+    # Only the hourly frames some scene can join against (≤7 per scene),
+    # not every hour of [start_date, end_date].  The date bounds are padded
+    # so scenes at either end still see their full ±3 h window.
+    hours = coll.aggregate_array("system:time_start").map(
+        lambda t: ee.List.sequence(-3, 3).map(
+            lambda k: ee.Number(t).divide(_HOUR_MS).floor().add(k)
+            .multiply(_HOUR_MS).toInt64()
+        )
+    ).flatten().distinct()
+    era5 = (
+        ee.ImageCollection("ECMWF/ERA5/HOURLY")
+        .filterDate(
+            ee.Date(start_date).advance(-3, "hour"),
+            ee.Date(end_date).advance(3, "hour"),
+        )
+        .filter(ee.Filter.inList("system:time_start", hours))
+        .select(["u_component_of_wind_10m", "v_component_of_wind_10m"])
+    )
+
+    def mag(img):
+        """Return img with a single band 'wind' = √(u²+v²)."""
+        w = (
+            img.select("u_component_of_wind_10m")
+            .hypot(img.select("v_component_of_wind_10m"))
+            .rename("wind")
+        )
+        return w.copyProperties(img, img.propertyNames())
+
+    era5 = era5.map(mag)
+    coll = ee.ImageCollection(
+        ee.Join.saveAll(matchesKey="ERA5_MATCHES", outer=True).apply(
+            coll, era5, _within("system:time_start", 3 * _HOUR_MS),
+        )
+    )
+
+    def add_wind(img):
+        wind = ee.ImageCollection.fromImages(img.get("ERA5_MATCHES")).median()
+
+        speed = wind.select("wind").reduceRegion(
+            reducer=ee.Reducer.mean(),
+            geometry=region,
+            scale=25_000,           # ~0.25° at equator
+            bestEffort=True,
+        ).get("wind")
+
+        return img.set("WIND_SPEED", speed)
+
+    return coll.map(add_wind)
+
+
+@lru_cache(maxsize=8)
+def _to_4326(crs_wkt):
+    return pyproj.Transformer.from_crs(
+        pyproj.CRS.from_wkt(crs_wkt), 4326, always_xy=True
+    ).transform
 
 
 # ---------------------------------------------------------------------
 def filter_scenes(
-    aoi_gdf,
+    geom,
+    crs,
     start_date,
     end_date,
     *,
@@ -39,130 +209,99 @@ def filter_scenes(
     wind_thresh=None,
     tidal_thresh=None,          
     max_scenes=50,
+    use_cache=True,
+    lazy=False,
 ):
     """
     Return list[dict] with keys id / date / cloud / chla / wind for every
     Sentinel-2 SR scene that passes the thresholds.
 
+    `geom` is a shapely geometry in `crs` (anything pyproj accepts; None
+    means EPSG:4326) – no GeoDataFrame needed per tile.  For a whole
+    GeoDataFrame use filter_scenes_gdf.
+
+    Results are cached on disk (MHP_CACHE_DIR/scenes, 1-day TTL) keyed on
+    the AOI geometry and all filter arguments; pass use_cache=False to
+    force a fresh Earth Engine query.
+
+    With lazy=True nothing is fetched: the filtered ee.ImageCollection is
+    returned as-is (and the cache is bypassed) so it can be handed straight
+    to cloud_runner.process_tile_cloud(..., scenes=coll).
+
     Requires ee.Initialize() to be called before you enter.
     """
-    # AOI → ee.Geometry
-    aoi_ee = ee.Geometry(
-        aoi_gdf.to_crs(4326).geometry.unary_union.__geo_interface__
+    # AOI → ee.Geometry: a 4-number bbox is all filterBounds needs; the
+    # reducers get a simplified union (they run at 4.5–25 km anyway).
+    crs = pyproj.CRS.from_user_input(crs if crs is not None else 4326)
+    if crs.to_epsg() != 4326:
+        geom = _shp_transform(_to_4326(crs.to_wkt()), geom)
+    region = geom.simplify(_SIMPLIFY_DEG)
+
+    cache_path = _cache_path(
+        region, start_date, end_date, chla_thresh, cloud_thresh,
+        wind_thresh, tidal_thresh, max_scenes,
     )
+    if use_cache and not lazy:
+        cached = _cache_load(cache_path)
+        if cached is not None:
+            logger.info("Found %d filtered scenes (cached).", len(cached))
+            return cached
+
+    bbox_ee  = ee.Geometry.BBox(*geom.bounds)
+    aoi_ee   = ee.Geometry(region.__geo_interface__)
 
     # 1) Sentinel-2 base collection  -----------------------------------
     coll = (
         ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED")
         .filterDate(start_date, end_date)
-        .filterBounds(aoi_ee)
+        .filterBounds(bbox_ee)
         .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", cloud_thresh))
         .filter(tide_ok(aoi_ee, thresh_m=tidal_thresh))          
     )
 
     # 2) CHL-a filter  (JAXA GCOM-C V3 – 8-day)  -----------------------
     if chla_thresh is not None:
-        chla_coll = (
-            ee.ImageCollection("JAXA/GCOM-C/L3/OCEAN/CHLA/V3")
-            .filterDate(start_date, end_date)
-        )
-
-        def add_chla(img):
-            d   = ee.Date(img.get("system:time_start"))
-            day = chla_coll.filterDate(d, d.advance(1, "day")).median()
-
-            band = ee.String(
-                ee.Algorithms.If(
-                    day.bandNames().contains("CHLA_AVE"),
-                    "CHLA_AVE",
-                    "chlor_a",
-                )
-            )
-
-            median = day.select(band).reduceRegion(
-                reducer   = ee.Reducer.median(),
-                geometry  = aoi_ee,
-                scale     = 4_500,          # native ≈4.6 km
-                bestEffort=True,
-            ).get(band)
-
-            return img.set("CHLA_MEDIAN", _safe_set(median))
-
         coll = (
-            coll.map(add_chla)
-            .filter(ee.Filter.lt("CHLA_MEDIAN", chla_thresh))
+            add_chla_median(coll, aoi_ee, start_date, end_date)
+            .filter(lt_or_missing("CHLA_MEDIAN", chla_thresh))
         )
 
     # 3) Wind speed filter  (ERA5 HOURLY, 0.25°)  ----------------------
     if wind_thresh is not None:
-        era5 = (
-            ee.ImageCollection("ECMWF/ERA5/HOURLY")
-            .filterDate(start_date, end_date)
-            .select(["u_component_of_wind_10m", "v_component_of_wind_10m"])
-        )
-
-        def mag(img):
-            """Return img with a single band 'wind' = √(u²+v²)."""
-            w = img.expression(
-                "sqrt(u*u + v*v)",
-                {
-                    "u": img.select("u_component_of_wind_10m"),
-                    "v": img.select("v_component_of_wind_10m"),
-                },
-            ).rename("wind")
-            return w.copyProperties(img, img.propertyNames())
-
-        era5 = era5.map(mag)
-
-        def add_wind(img):
-            t = ee.Date(img.get("system:time_start"))
-            wind = (
-                era5.filterDate(t.advance(-3, "hour"), t.advance(3, "hour"))
-                .median()
-            )
-
-            speed = wind.select("wind").reduceRegion(
-                reducer=ee.Reducer.mean(),
-                geometry=aoi_ee,
-                scale=25_000,           # ~0.25° at equator
-                bestEffort=True,
-            ).get("wind")
-
-            return img.set("WIND_SPEED", _safe_set(speed))
-
         coll = (
-            coll.map(add_wind)
-            .filter(ee.Filter.lt("WIND_SPEED", wind_thresh))
+            add_wind_speed(coll, aoi_ee, start_date, end_date)
+            .filter(lt_or_missing("WIND_SPEED", wind_thresh))
         )
 
     # 4) Cap the number of scenes  -------------------------------------
     if max_scenes:
         coll = coll.limit(max_scenes)
 
-    # 5) Bring metadata back to Python  --------------------------------
-    ids    = coll.aggregate_array("system:index").getInfo()
-    times  = coll.aggregate_array("system:time_start").getInfo()
-    clouds = coll.aggregate_array("CLOUDY_PIXEL_PERCENTAGE").getInfo()
-    chlas  = (
-        coll.aggregate_array("CHLA_MEDIAN").getInfo()
-        if chla_thresh is not None else [None] * len(ids)
-    )
-    winds  = (
-        coll.aggregate_array("WIND_SPEED").getInfo()
-        if wind_thresh is not None else [None] * len(ids)
+    if lazy:
+        return coll
+
+    # 5) Bring metadata back to Python  (one round-trip)  -------------
+    # No bands, no geometry – only the allow-listed scalar properties.
+    props = coll.select([]).map(
+        lambda img: ee.Feature(None, {
+            key: img.get(prop) for key, prop in _SCENE_PROPS.items()
+        })
+    ).getInfo()
+
+    # EE nulls arrive as None; missing keys / NaN → None, one to_dict pass.
+    df = pd.DataFrame(
+        [f["properties"] for f in props["features"]], columns=list(_SCENE_PROPS)
     )
+    scenes = df.astype(object).where(df.notna(), None).to_dict("records")
 
-    scenes = [
-        {
-            "id":    sid,
-            "date":  ts,
-            "cloud": cl,
-            "chla":  _to_python(ch),
-            "wind":  _to_python(w),
-        }
-        for sid, ts, cl, ch, w in zip(ids, times, clouds, chlas, winds)
-    ]
-
-    print(f"Found {len(scenes)} filtered scenes.")
+    _cache_store(cache_path, scenes)
+    logger.info("Found %d filtered scenes.", len(scenes))
     return scenes
+
+
+def filter_scenes_gdf(aoi_gdf, start_date, end_date, **kwargs):
+    """filter_scenes for a GeoDataFrame AOI (all features unioned)."""
+    geoms = aoi_gdf.geometry
+    geom  = geoms.iloc[0] if len(geoms) == 1 else geoms.unary_union
+    return filter_scenes(geom, aoi_gdf.crs, start_date, end_date, **kwargs)
 # ---------------------------------------------------------------------
@@ -12,13 +12,18 @@ Run one tile through ACOLITE in  ❱ the current container  (preferred)  or
 
 from __future__ import annotations
 
-import json
+import asyncio
+import logging
 import os
 import shutil
 import subprocess
 from pathlib import Path
 from typing import Dict, Optional
 
+from ..utils.io import json_dumps
+
+logger = logging.getLogger(__name__)
+
 # --------------------------------------------------------------------- constants
 ACOLITE_CLI_IN_CONTAINER = os.getenv(
     "ACOLITE_CLI",
@@ -41,7 +46,7 @@ def _write_tile_geojson(tile_geom, tile_id: str, outdir: Path) -> Path:
         }]
     }
     aoi_path = outdir / f"{tile_id}_aoi.geojson"
-    aoi_path.write_text(json.dumps(gj))
+    aoi_path.write_bytes(json_dumps(gj))
     return aoi_path
 
 
@@ -51,14 +56,22 @@ def _have_docker() -> bool:
 
 
 def _run(cmd: list[str]) -> None:
-    print("  $", " ".join(cmd))
+    logger.debug("  $ %s", " ".join(cmd))
     subprocess.run(cmd, check=True)
 
 
+async def _run_async(cmd: list[str]) -> None:
+    """Like _run, but awaitable so several ACOLITE runs can overlap."""
+    logger.debug("  $ %s", " ".join(cmd))
+    # Output is inherited (not piped) – nothing to drain, no pipe deadlock
+    proc = await asyncio.create_subprocess_exec(*cmd)
+    if await proc.wait():
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
 # ------------------------------------------------------------ run in container
-def _run_acolite_direct(tile_geom, tile_id: str,
-                        config: Dict, outdir: Path) -> Optional[str]:
-    """Use the ACOLITE copy bundled in this image."""
+def _direct_cmd(tile_geom, tile_id: str,
+                config: Dict, outdir: Path) -> list[str]:
     aoi = _write_tile_geojson(tile_geom, tile_id, outdir)
     cli = config.get("acolite_cli_path", ACOLITE_CLI_IN_CONTAINER)
     s2  = config.get("offline_s2_path", "/input/S2")
@@ -73,25 +86,12 @@ def _run_acolite_direct(tile_geom, tile_id: str,
     ]
     if config.get("acolite_extra_args"):
         cmd.extend(config["acolite_extra_args"].split())
-
-    print(f"Running ACOLITE inside container for {tile_id}")
-    try:
-        _run(cmd)
-        print(f"✅ ACOLITE finished for {tile_id}")
-        return str(outdir)
-    except subprocess.CalledProcessError as e:
-        print(f"❌ ACOLITE failed for {tile_id}: {e}")
-        return None
+    return cmd
 
 
 # ------------------------------------------------------------- run child image
-def _run_acolite_child_docker(tile_geom, tile_id: str,
-                              config: Dict, outdir: Path) -> Optional[str]:
-    """Spin up a separate `acolite/acolite` image (Docker-in-Docker)."""
-    if not _have_docker():
-        print("Docker CLI not found in this container – cannot run child image.")
-        return None
-
+def _child_cmd(tile_geom, tile_id: str,
+               config: Dict, outdir: Path) -> list[str]:
     aoi = _write_tile_geojson(tile_geom, tile_id, outdir)
     img = config.get("acolite_docker_img", "acolite/acolite:latest")
     s2  = os.path.abspath(config.get("offline_s2_path", "/input/S2"))
@@ -111,15 +111,32 @@ def _run_acolite_child_docker(tile_geom, tile_id: str,
     ]
     if config.get("acolite_extra_args"):
         cmd.extend(config["acolite_extra_args"].split())
+    return cmd
 
-    print(f"Running ACOLITE child-docker for {tile_id}")
-    try:
-        _run(cmd)
-        print(f"✅ Child ACOLITE finished for {tile_id}")
-        return str(outdir)
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Child ACOLITE failed for {tile_id}: {e}")
-        return None
+
+# ------------------------------------------------------------------ strategy
+def _select_cmd(tile_geom, tile_id: str, config: Dict,
+                outdir: Path) -> Optional[tuple[list[str], str]]:
+    """
+    Pick the ACOLITE strategy for this tile → (cmd, log label), or None if
+    neither the bundled ACOLITE nor the Docker CLI is available.
+    """
+    # Prefer bundled ACOLITE if present
+    if Path(ACOLITE_CLI_IN_CONTAINER).exists():
+        logger.info("Running ACOLITE inside container for %s", tile_id)
+        return _direct_cmd(tile_geom, tile_id, config, outdir), "ACOLITE"
+
+    # Fallback: child image (Docker-in-Docker)
+    if _have_docker():
+        logger.info("Running ACOLITE child-docker for %s", tile_id)
+        return _child_cmd(tile_geom, tile_id, config, outdir), "Child ACOLITE"
+
+    logger.warning("Docker CLI not found in this container – cannot run child image.")
+    return None
+
+
+def _outdir(tile_id: str, config: Dict) -> Path:
+    return Path(config.get("offline_output_dir", "outputs/offline")) / tile_id
 
 
 # -------------------------------------------------------------- public entry
@@ -128,11 +145,35 @@ def process_tile_offline(tile_geom, tile_id: str,
     """
     Decide strategy → run ACOLITE → return output folder (or None on failure).
     """
-    outdir = Path(config.get("offline_output_dir", "outputs/offline")) / tile_id
+    outdir = _outdir(tile_id, config)
+    selected = _select_cmd(tile_geom, tile_id, config, outdir)
+    if selected is None:
+        return None
+    cmd, label = selected
+    try:
+        _run(cmd)
+    except subprocess.CalledProcessError as e:
+        logger.error("❌ %s failed for %s: %s", label, tile_id, e)
+        return None
+    logger.info("✅ %s finished for %s", label, tile_id)
+    return str(outdir)
 
-    # Prefer bundled ACOLITE if present
-    if Path(ACOLITE_CLI_IN_CONTAINER).exists():
-        return _run_acolite_direct(tile_geom, tile_id, config, outdir)
 
-    # Fallback: child image
-    return _run_acolite_child_docker(tile_geom, tile_id, config, outdir)
+async def process_tile_offline_async(tile_geom, tile_id: str,
+                                     config: Dict) -> Optional[str]:
+    """
+    Awaitable process_tile_offline – same strategy choice and return value,
+    but the ACOLITE subprocess does not block the event loop.
+    """
+    outdir = _outdir(tile_id, config)
+    selected = _select_cmd(tile_geom, tile_id, config, outdir)
+    if selected is None:
+        return None
+    cmd, label = selected
+    try:
+        await _run_async(cmd)
+    except subprocess.CalledProcessError as e:
+        logger.error("❌ %s failed for %s: %s", label, tile_id, e)
+        return None
+    logger.info("✅ %s finished for %s", label, tile_id)
+    return str(outdir)
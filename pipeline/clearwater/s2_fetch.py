@@ -11,17 +11,20 @@ using the Copernicus Open Access Hub API (e.g. via `sentinelsat`).
 For now it just prints what it *would* do and returns a dummy task-id string.
 """
 
+import logging
 from pathlib import Path
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 def fetch_scenes(*, aoi_wkt: str, start: str, end: str,
                  user: str, pwd: str, outdir: Path) -> str:
     """Stub – log parameters and pretend the download is done."""
-    print("⚠ [s2_fetch] stub called")
-    print(f"    AOI WKT  : {aoi_wkt[:60]}…")
-    print(f"    Date     : {start} → {end}")
-    print(f"    User     : {user!r}")
-    print(f"    Out dir  : {outdir}")
+    logger.warning("⚠ [s2_fetch] stub called")
+    logger.info("    AOI WKT  : %s…", aoi_wkt[:60])
+    logger.info("    Date     : %s → %s", start, end)
+    logger.info("    User     : %r", user)
+    logger.info("    Out dir  : %s", outdir)
     outdir.mkdir(parents=True, exist_ok=True)
     # touch a sentinel file so downstream code can see something
     (outdir / "DOWNLOAD_COMPLETE.flag").touch()
@@ -1,67 +1,186 @@
+from __future__ import annotations
+
+import logging
+
 import geopandas as gpd
+import numpy as np
+import pyproj
+import shapely
 from shapely.geometry import box
 from itertools import product
 
-def load_aoi(aoi_path):
+from ..utils.geo import read_file
+
+logger = logging.getLogger(__name__)
+
+# Shapely 2 exposes vectorised (ufunc) constructors such as shapely.box
+_SHAPELY2 = int(shapely.__version__.split(".")[0]) >= 2
+
+# Built once per process instead of once per to_crs call
+_TO_3857 = pyproj.Transformer.from_crs(4326, 3857, always_xy=True)
+_TO_4326 = pyproj.Transformer.from_crs(3857, 4326, always_xy=True)
+
+
+def _reproject(geoms, transformer):
+    """Run all vertices of `geoms` through `transformer` in one call."""
+    return shapely.transform(
+        np.asarray(geoms),
+        lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1])),
+    )
+
+def load_aoi(aoi_path, return_proj=False):
     """
-    Load an AOI from file into a GeoDataFrame (EPSG:4326),
-    report its area in km², and return.
+    Load an AOI from file into a GeoDataFrame (EPSG:4326) and return it.
+    The area in km² is only computed when INFO logging is enabled.
+
+    With return_proj=True also return the EPSG:3857 view used for the
+    area report, so buffer_aoi / split_aoi_to_tiles can reuse it instead
+    of reprojecting again: (gdf, gdf_proj).
     """
-    gdf = gpd.read_file(aoi_path)
+    gdf = read_file(aoi_path)
     if gdf.crs is None:
         gdf.set_crs(epsg=4326, inplace=True)
+    verbose  = logger.isEnabledFor(logging.INFO)
+    gdf_proj = gdf.to_crs(epsg=3857) if (verbose or return_proj) else None
     # Compute area for reporting
-    gdf_proj = gdf.to_crs(epsg=3857)
-    area_km2 = gdf_proj.geometry.area.sum() / 1e6
-    print(f"Loaded AOI: {aoi_path} ({area_km2:.2f} km²)")
-    return gdf
+    if verbose:
+        if _SHAPELY2:
+            area_m2 = shapely.area(np.asarray(gdf_proj.geometry.values)).sum()
+        else:
+            area_m2 = gdf_proj.geometry.area.sum()
+        logger.info("Loaded AOI: %s (%.2f km²)", aoi_path, area_m2 / 1e6)
+    return (gdf, gdf_proj) if return_proj else gdf
 
-def buffer_aoi(gdf, buffer_km=2):
+def buffer_aoi(gdf, buffer_km=2, gdf_proj=None):
     """
     Buffer an AOI GeoDataFrame by buffer_km (in meters),
     reprojecting back to the original CRS.
+
+    gdf_proj: optional EPSG:3857 view of `gdf` (see load_aoi) – skips
+    the forward reprojection.
     """
-    gdf_proj = gdf.to_crs(epsg=3857)
-    buffered = gdf_proj.geometry.buffer(buffer_km * 1000)
-    # Wrap back into a GeoDataFrame and reproject
-    buf_gdf = gpd.GeoDataFrame(
-        geometry=buffered, crs=gdf_proj.crs
-    ).to_crs(gdf.crs)
-    print(f"Buffered AOI by {buffer_km} km")
+    if _SHAPELY2 and gdf.crs == "EPSG:4326":
+        # Whole-array path: one transformer pass each way, one buffer ufunc
+        merc = (
+            np.asarray(gdf_proj.geometry.values) if gdf_proj is not None
+            else _reproject(gdf.geometry.values, _TO_3857)
+        )
+        buffered = shapely.buffer(merc, buffer_km * 1000, quad_segs=16)  # = GeoSeries.buffer default
+        buf_gdf  = gpd.GeoDataFrame(
+            geometry=_reproject(buffered, _TO_4326), crs=gdf.crs
+        )
+    else:
+        if gdf_proj is None:
+            gdf_proj = gdf.to_crs(epsg=3857)
+        buffered = gdf_proj.geometry.buffer(buffer_km * 1000)
+        # Wrap back into a GeoDataFrame and reproject
+        buf_gdf = gpd.GeoDataFrame(
+            geometry=buffered, crs=gdf_proj.crs
+        ).to_crs(gdf.crs)
+    logger.info("Buffered AOI by %s km", buffer_km)
     return buf_gdf
 
-def split_aoi_to_tiles(aoi_gdf: gpd.GeoDataFrame, tile_size_km: float = 1.0) -> gpd.GeoDataFrame:
+def split_aoi_to_tiles(
+    aoi_gdf: gpd.GeoDataFrame,
+    tile_size_km: float = 1.0,
+    aoi_proj: gpd.GeoDataFrame | None = None,
+) -> gpd.GeoDataFrame:
     """
     Split an AOI GeoDataFrame into square tiles of size tile_size_km.
+    Pass aoi_proj (the EPSG:3857 view from load_aoi) to skip reprojecting.
 
     Returns a GeoDataFrame in EPSG:4326 with columns:
       - tile_id: "tile_<col>_<row>"
       - geometry: the intersection of each tile with the AOI
     """
     # 1) Project to Web Mercator so that distances are in meters
-    merc = aoi_gdf.to_crs(epsg=3857)
+    if aoi_proj is not None:
+        merc = aoi_proj
+    elif _SHAPELY2 and aoi_gdf.crs == "EPSG:4326":
+        merc = gpd.GeoDataFrame(
+            geometry=_reproject(aoi_gdf.geometry.values, _TO_3857), crs=3857
+        )
+    else:
+        merc = aoi_gdf.to_crs(epsg=3857)
     minx, miny, maxx, maxy = merc.total_bounds
 
+    # AOI as one geometry – used for both the tile filter and the clip.
+    # A single feature needs no union at all.
+    if len(merc) == 1:
+        aoi_union = merc.geometry.iloc[0]
+    elif _SHAPELY2:
+        aoi_union = shapely.unary_union(np.asarray(merc.geometry.values))
+    else:
+        aoi_union = merc.unary_union
+
     size_m = tile_size_km * 1000.0
     cols = int((maxx - minx) // size_m) + 1
     rows = int((maxy - miny) // size_m) + 1
 
-    # 2) Generate the grid of boxes
-    tiles = []
-    for i, j in product(range(cols), range(rows)):
-        x0 = minx + i * size_m
-        y0 = miny + j * size_m
-        tile_geom = box(x0, y0, x0 + size_m, y0 + size_m)
-        tiles.append({
-            'tile_id': f'tile_{i:03d}_{j:03d}',
-            'geometry': tile_geom
-        })
-
-    # 3) Make a GeoDataFrame of all tiles and intersect with the AOI
-    tiles_gdf = gpd.GeoDataFrame(tiles, crs=3857)
-    intersected = gpd.overlay(tiles_gdf, merc, how='intersection')
-
-    # 4) Reproject back to WGS84 (EPSG:4326) and return only tile_id & geometry
-    result = intersected.to_crs(epsg=4326)[['tile_id', 'geometry']]
-    print(f"Split AOI into {len(result)} tiles (~{tile_size_km} km each)")
+    # 2) Generate the grid of boxes (column-major: i outer, j inner)
+    ii, jj = np.meshgrid(np.arange(cols), np.arange(rows), indexing='ij')
+    ii, jj = ii.ravel(), jj.ravel()
+    if _SHAPELY2:
+        # Cull before any per-tile GEOS work: clip the AOI to each grid
+        # column and keep only the rows inside that strip's y-range.  For a
+        # thin diagonal coastline most of the bbox grid is dropped here.
+        strip_x = minx + np.arange(cols) * size_m
+        strip_b = shapely.bounds(np.array([
+            shapely.clip_by_rect(aoi_union, x, miny, x + size_m, maxy)
+            for x in strip_x
+        ]))                                    # empty strip → NaN → culled
+        y0   = miny + jj * size_m
+        cand = (y0 + size_m > strip_b[ii, 1]) & (y0 < strip_b[ii, 3])
+        ii, jj, y0 = ii[cand], jj[cand], y0[cand]
+        x0 = minx + ii * size_m
+        geoms = shapely.box(x0, y0, x0 + size_m, y0 + size_m)
+    else:
+        geoms = [
+            box(minx + i * size_m, miny + j * size_m,
+                minx + (i + 1) * size_m, miny + (j + 1) * size_m)
+            for i, j in product(range(cols), range(rows))
+        ]
+    tile_ids = np.char.add(
+        np.char.add('tile_', np.char.zfill(ii.astype(str), 3)),
+        np.char.add('_', np.char.zfill(jj.astype(str), 3)),
+    )
+
+    # 3) Intersect the tiles with the AOI
+    if _SHAPELY2:
+        # One tree query drops every tile that misses the AOI (sparse reef
+        # chains leave most of the bbox grid empty).  Tiles the AOI covers
+        # are kept verbatim; only those crossing its boundary are clipped.
+        shapely.prepare(aoi_union)
+        keep_idx  = np.unique(
+            shapely.STRtree(geoms).query(aoi_union, predicate='intersects')
+        )
+        out  = geoms[keep_idx]
+        edge = ~shapely.covers(aoi_union, out)
+        out[edge] = shapely.intersection(out[edge], aoi_union)
+        ok = ~shapely.is_empty(out) & (shapely.area(out) > 0)
+
+        # 4) Reproject back to WGS84 (EPSG:4326), built straight from arrays
+        result = gpd.GeoDataFrame(
+            {
+                'tile_id': tile_ids[keep_idx][ok],
+                'geometry': gpd.GeoSeries(_reproject(out[ok], _TO_4326), crs=4326),
+            },
+            crs=4326,
+        )
+    else:
+        # Shapely < 2: sjoin's spatial index finds the touching tiles, then
+        # clip just those (no pairwise overlay).
+        tiles_gdf = gpd.GeoDataFrame({'tile_id': tile_ids, 'geometry': geoms}, crs=3857)
+        touching  = gpd.sjoin(
+            tiles_gdf, merc[['geometry']], how='inner', predicate='intersects'
+        )
+        touching  = touching[~touching.index.duplicated()].sort_index()
+        touching  = touching.set_geometry(
+            touching.geometry.intersection(aoi_union)
+        )
+        touching  = touching[~touching.geometry.is_empty & (touching.geometry.area > 0)]
+        # 4) Reproject back to WGS84 (EPSG:4326), keep only tile_id & geometry
+        result = touching.to_crs(epsg=4326)[['tile_id', 'geometry']]
+
+    logger.info("Split AOI into %d tiles (~%s km each)", len(result), tile_size_km)
     return result
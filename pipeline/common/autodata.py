@@ -1,39 +1,75 @@
-import os, requests, zipfile, tempfile, ee
+import logging, os, shutil, urllib.error, urllib.request, zipfile, tempfile, ee
+from functools import lru_cache
 from pathlib import Path
 
 CACHE = Path(os.getenv("MHP_CACHE_DIR", "~/.mhp_cache")).expanduser()
+
+logger = logging.getLogger(__name__)
 SRC_ZIP = "https://api.researchdata.se/dataset/ecds0243-1/1.0/file/zip"
 
 # ------------------------------------------------------------------#
 # Helpers                                                           #
 # ------------------------------------------------------------------#
+def _download(url: str, dest: Path) -> None:
+    """
+    Stream `url` to `dest` in 16 MiB copies (no per-chunk Python loop),
+    via a .part file so an interrupted run never leaves a truncated zip.
+    The ETag is kept next to `dest`; if `dest` already exists it is only
+    re-fetched when the server reports a change (If-None-Match → 304).
+    """
+    etag_file = dest.with_name(dest.name + ".etag")
+    req = urllib.request.Request(url)
+    if dest.exists():
+        if not etag_file.exists():
+            return                         # cached before ETags were kept
+        req.add_header("If-None-Match", etag_file.read_text().strip())
+
+    part = dest.with_name(dest.name + ".part")
+    try:
+        with urllib.request.urlopen(req, timeout=3600) as r, open(part, "wb") as f:
+            shutil.copyfileobj(r, f, length=16 << 20)
+            etag = r.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        if e.code == 304:                  # unchanged on the server
+            return
+        raise
+    part.replace(dest)
+    if etag:
+        etag_file.write_text(etag)
+
 def _asset_id() -> str:
     """Compute the tidal-range asset path *after* EE is initialized."""
     root = ee.data.getAssetRoots()[0]["id"]            # users/<name>
     user = root.split("/")[1]
     return f"users/{user}/global_tidal_range"
 
+@lru_cache(maxsize=1)
 def ensure_tidal_asset():
-    """Download + upload the 5-km tidal-range raster exactly once."""
+    """
+    Download + upload the 5-km tidal-range raster exactly once.
+    The check is cached per process only: the asset path depends on the EE
+    account, so an on-disk marker could hand another account a wrong path.
+    """
     asset = _asset_id()
     try:
+        ee.data.getAsset(asset)  # ee.Image() is lazy and never raises here
         return ee.Image(asset)
-    except Exception:
+    except ee.EEException:
         pass                     # not found → fall through and ingest
 
     CACHE.mkdir(parents=True, exist_ok=True)
     z = CACHE / "tidal_range.zip"
     if not z.exists():
-        print("▶ Downloading global tidal-range raster … (~115 MB)")
-        with requests.get(SRC_ZIP, stream=True, timeout=3600) as r:
-            r.raise_for_status()
-            with open(z, "wb") as f:
-                for chunk in r.iter_content(2 << 20):
-                    f.write(chunk)
-
-    with tempfile.TemporaryDirectory() as td:
-        zipfile.ZipFile(z).extract("annual_max_cycle_amp_cm.tif", td)
-        tif = os.path.join(td, "annual_max_cycle_amp_cm.tif")
+        logger.info("▶ Downloading global tidal-range raster … (~115 MB)")
+    _download(SRC_ZIP, z)
+
+    # Stream the one member we need straight into a temp .tif – no
+    # extraction tree, one decompress pass.
+    with zipfile.ZipFile(z) as zf, zf.open("annual_max_cycle_amp_cm.tif") as src, \
+            tempfile.NamedTemporaryFile(suffix=".tif") as dst:
+        shutil.copyfileobj(src, dst, length=16 << 20)
+        dst.flush()
+        tif = dst.name
         task_id = ee.data.newTaskId()[0]
         task = ee.data.startIngestion(task_id, {
             "id": asset,
@@ -1,6 +1,18 @@
-import json
+import copy
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from .utils.io import json_loads
+
+
+@lru_cache(maxsize=8)
+def _load_config_cached(config_path, mtime):
+    return json_loads(Path(config_path).read_bytes())
+
 
 def load_config(config_path="data/config.example.json"):
-    with open(config_path) as f:
-        config = json.load(f)
-    return config
\ No newline at end of file
+    # Keyed on mtime so an edited file is re-read; deep-copied so callers
+    # can mutate their config without corrupting the cached one.
+    mtime = os.path.getmtime(config_path)
+    return copy.deepcopy(_load_config_cached(config_path, mtime))
@@ -17,23 +17,30 @@ python -m pipeline.entrypoint clearwater \
 from __future__ import annotations
 
 import argparse
+import asyncio
+import io
 import json
+import logging
 import os
 import sys
-import tempfile
 import textwrap
 import pathlib
 import urllib.request
 import urllib.parse
-from typing import List, Dict
-
-import geopandas as gpd
-import shapely.geometry as _shp
-import ee
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Dict
 
 from .common.autodata import ensure_tidal_asset
-from .clearwater import tiler, cloud_runner, offline_runner, estimate
+from .clearwater import offline_runner, estimate
 from .clearwater.s2_fetch import fetch_scenes
+from .utils.gee_utils import HIGH_VOLUME_URL, initialize_ee
+from .utils.io import json_loads
+from .utils.logging import configure_logging
+
+if TYPE_CHECKING:           # geopandas is imported lazily – see _load_aoi
+    import geopandas as gpd
+
+logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------
 DEF_CFG: Dict[str, float | int] = {
@@ -55,18 +62,32 @@ DEF_CFG: Dict[str, float | int] = {
 # Helper functions
 # ---------------------------------------------------------------------
 
+@lru_cache(maxsize=8)
+def _read_aoi_cached(path: str, mtime: float) -> gpd.GeoDataFrame:
+    from .utils.geo import read_file
+    return read_file(path)
+
+
 def _load_aoi(aoi_str: str) -> gpd.GeoDataFrame:
     """Load AOI from path, URL or inline GeoJSON."""
+    # geopandas/pyogrio cost ~0.5 s to import – only pay it when needed
+    import geopandas as gpd
+    from .utils.geo import read_file
+
     aoi_str = aoi_str.strip()
     if aoi_str.startswith("{"):
-        return gpd.GeoDataFrame.from_features(json.loads(aoi_str))
+        return gpd.GeoDataFrame.from_features(json_loads(aoi_str))
     parsed = urllib.parse.urlparse(aoi_str)
     if parsed.scheme in ("http", "https", "ftp"):
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".geojson")
-        tmp.write(urllib.request.urlopen(aoi_str).read())
-        tmp.close()
-        return gpd.read_file(tmp.name)
-    return gpd.read_file(aoi_str)
+        # Parse straight from memory – no temp file round-trip
+        data = urllib.request.urlopen(aoi_str, timeout=60).read()
+        try:
+            return read_file(io.BytesIO(data))
+        except Exception:        # engine can't sniff it → plain GeoJSON
+            return gpd.GeoDataFrame.from_features(json_loads(data), crs=4326)
+    # Local file: re-parse only when it changed; copy so callers can't
+    # mutate the cached frame.
+    return _read_aoi_cached(aoi_str, os.path.getmtime(aoi_str)).copy()
 
 
 def _decide_mode(tile_stats: List[dict], cfg: dict, force: str | None) -> str:
@@ -86,20 +107,58 @@ def _decide_mode(tile_stats: List[dict], cfg: dict, force: str | None) -> str:
 # Clearwater lane entry-point
 # ---------------------------------------------------------------------
 
+async def _clearwater_offline(jobs, cfg: dict, user, pwd,
+                              outdir: pathlib.Path) -> List[str | None]:
+    """
+    Fetch scenes + run ACOLITE for every (geom, tile_id), at most
+    cfg["offline_concurrency"] tiles at a time.  Results keep job order.
+    """
+    sem = asyncio.Semaphore(cfg.get("offline_concurrency", os.cpu_count() or 1))
+
+    async def _one(geom, tid):
+        async with sem:
+            await asyncio.to_thread(
+                fetch_scenes,
+                aoi_wkt=geom.wkt,
+                start=cfg["start_date"],
+                end=cfg["end_date"],
+                user=user,
+                pwd=pwd,
+                outdir=outdir,
+            )
+            return await offline_runner.process_tile_offline_async(geom, tid, cfg)
+
+    return await asyncio.gather(*(_one(geom, tid) for geom, tid in jobs))
+
+
 def clearwater(args: argparse.Namespace) -> None:
     """Run Lane 1 clear-water mosaic."""
     # ---------- 1. Earth Engine login ----------
     if args.gee_service_account:
         sa_key = pathlib.Path(args.gee_service_account)
-        sa_email = json.loads(sa_key.read_text())["client_email"]
-        creds = ee.ServiceAccountCredentials(sa_email, sa_key)
-        ee.Initialize(credentials=creds)
+        sa_email = json_loads(sa_key.read_bytes())["client_email"]
+        initialize_ee(service_account=sa_email, key_path=str(sa_key),
+                      interactive=not args.non_interactive)
     else:
-        ee.Initialize()  # uses ~/.config/earthengine
+        # ~/.config/earthengine credentials; no-op if already initialised.
+        # Try the file and then ADC (GCE / Cloud Run metadata, container
+        # logins – what a plain ee.Initialize() picks up) before prompting.
+        import ee
+        try:
+            initialize_ee(interactive=False)
+        except FileNotFoundError:
+            project = (os.environ.get("EARTHENGINE_PROJECT")
+                       or os.environ.get("GEE_PROJECT"))
+            try:
+                ee.Initialize(project=project, opt_url=HIGH_VOLUME_URL)
+            except Exception:
+                if args.non_interactive:
+                    raise
+                initialize_ee(interactive=True)
 
     # ---------- 2. Copernicus creds ----------
     if args.copernicus_creds:
-        cdse = json.loads(pathlib.Path(args.copernicus_creds).read_text())
+        cdse = json_loads(pathlib.Path(args.copernicus_creds).read_bytes())
         user, pwd = cdse.get("user"), cdse.get("pass")
     else:
         user, pwd = args.copernicus_user, args.copernicus_pass
@@ -108,49 +167,46 @@ def clearwater(args: argparse.Namespace) -> None:
     ensure_tidal_asset()
 
     # ---------- 3. AOI & tiling ----------
+    from .clearwater import tiler, cloud_runner     # heavy: geo stack + ee
     aoi = _load_aoi(args.aoi)
-    tiles = tiler.split_aoi(aoi, km=1)
+    tiles = tiler.split_aoi_to_tiles(aoi, tile_size_km=1)
 
     # ---------- 4. Build config ----------
     cfg_path = pathlib.Path(args.config or "config.json")
     cfg = DEF_CFG.copy()
     if cfg_path.exists():
-        cfg.update(json.loads(cfg_path.read_text()))
+        cfg.update(json_loads(cfg_path.read_bytes()))
+    out   = urllib.parse.urlparse(args.out)
+    is_s3 = out.scheme == "s3"
     cfg.update({
         "start_date": args.start,
         "end_date": args.end,
-        "gee_bucket": (
-            args.out.split("/", 3)[2] if args.out.startswith("s3://") else args.out
-        ),
-        "gee_folder": (
-            "/".join(args.out.split("/", 3)[3:]) if args.out.startswith("s3://") else ""
-        ),
+        "gee_bucket": out.netloc if is_s3 else args.out,
+        "gee_folder": out.path.lstrip("/") if is_s3 else "",
     })
-    cfg_path.write_text(json.dumps(cfg, indent=2))
+    cfg_path.write_text(json.dumps(cfg, indent=2))   # indented for humans
 
     # ---------- 5. Decide cloud/offline ----------
-    tile_stats = [{"n_scenes": cfg["max_scenes"]} for _ in tiles]
+    tile_stats = [{"n_scenes": cfg["max_scenes"]}] * len(tiles)
     mode = _decide_mode(tile_stats, cfg, args.force)
-    print(f"▶ Running Lane-1 in **{mode.upper()}** mode")
+    logger.info("▶ Running Lane-1 in **%s** mode", mode.upper())
 
     # ---------- 6. Process tiles ----------
+    # Column arrays, not per-row Series – the geometries are already shapely
+    jobs = [
+        (geom, f"{tid}_{idx:02}")
+        for idx, (tid, geom) in enumerate(
+            zip(tiles["tile_id"].to_numpy(), tiles.geometry.values)
+        )
+    ]
     task_ids: List[str] = []
-    for idx, tile in enumerate(tiles):
-        geom = _shp.shape(tile["geometry"].__geo_interface__)
-        tid = f"{tile['id']}_{idx:02}"
-        if mode == "cloud":
-            tid_out = cloud_runner.process_tile_cloud(geom, tid, cfg)
-        else:
-            fetch_scenes(
-                aoi_wkt=geom.wkt,
-                start=cfg["start_date"],
-                end=cfg["end_date"],
-                user=user,
-                pwd=pwd,
-                outdir=pathlib.Path(args.out) / "scenes",
-            )
-            tid_out = offline_runner.process_tile_offline(geom, tid, cfg)
-        task_ids.append(tid_out)
+    if mode == "cloud":
+        task_ids = cloud_runner.process_tiles_cloud(
+            jobs, cfg, max_workers=cfg.get("max_workers", cloud_runner.MAX_WORKERS)
+        )
+    else:
+        outdir = pathlib.Path(args.out) / "scenes"
+        task_ids = asyncio.run(_clearwater_offline(jobs, cfg, user, pwd, outdir))
 
     print("Tiles kicked off:", task_ids)
 
@@ -193,6 +249,7 @@ def _cli() -> argparse.Namespace:
 # ---------------------------------------------------------------------
 
 def main() -> None:
+    configure_logging()
     args = _cli()
     if args.command == "clearwater":
         clearwater(args)
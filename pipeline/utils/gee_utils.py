@@ -1,14 +1,37 @@
+from __future__ import annotations
+
 import ee
-import json
 import os
+from functools import lru_cache
 from pathlib import Path
 
+from .io import json_loads
+
+# Earth Engine high-volume endpoint – higher concurrent-request quota for
+# automated fan-out (many per-scene reducers / per-tile exports).
+HIGH_VOLUME_URL = "https://earthengine-highvolume.googleapis.com"
+
+# Arguments of the last successful initialize_ee() – repeat calls with the
+# same arguments (notebooks, tests, library use) return immediately.
+_EE_READY: tuple | None = None
+
+
+@lru_cache(maxsize=4)
+def _read_cfg_cached(path: str, mtime: float) -> dict:
+    return json_loads(Path(path).read_bytes())
+
+
+def _read_cfg(path: str) -> dict:
+    # Keyed on mtime so a config edited mid-session (notebooks) is re-read
+    return _read_cfg_cached(path, os.path.getmtime(path))
+
 
 def initialize_ee(config_path: str = None,
                   service_account: str = None,
                   key_path: str = None,
                   project: str = None,
-                  interactive: bool = False):
+                  interactive: bool = False,
+                  high_volume: bool = True):
     """
     Initialize Google Earth Engine client with guidance on errors.
 
@@ -20,12 +43,16 @@ def initialize_ee(config_path: str = None,
 
     If `interactive` is True, prompts for missing credentials or project ID.
 
+    If `high_volume` is True (default), requests go to the EE high-volume
+    endpoint instead of the standard one.
+
     Args:
         config_path: Path to JSON config with 'service_account', 'key_path', and optional 'project'.
         service_account: Service account email.
         key_path: Path to service account key JSON.
         project: GCP project ID for Earth Engine (can set env var EARTHENGINE_PROJECT/GEE_PROJECT).
         interactive: Prompt interactively if credentials/project missing.
+        high_volume: Use the high-volume endpoint (HIGH_VOLUME_URL).
 
     Raises:
         FileNotFoundError: If required credentials files are missing.
@@ -34,17 +61,25 @@ def initialize_ee(config_path: str = None,
     """
     # Determine project from args or environment
     project = project or os.environ.get('EARTHENGINE_PROJECT') or os.environ.get('GEE_PROJECT')
+    opt_url = HIGH_VOLUME_URL if high_volume else None
+
+    key = (config_path, service_account, key_path, project, opt_url)
+    if _EE_READY == key:
+        return
 
     def try_initialize(creds=None):
         """
-        Always call ee.Initialize with the explicit project override.
+        Always call ee.Initialize with the explicit project override
+        (and the high-volume endpoint unless disabled).
         If creds is None, we rely on personal CLI/ADC credentials.
         """
+        global _EE_READY
         try:
             if creds:
-                ee.Initialize(credentials=creds, project=project)
+                ee.Initialize(credentials=creds, project=project, opt_url=opt_url)
             else:
-                ee.Initialize(project=project)
+                ee.Initialize(project=project, opt_url=opt_url)
+            _EE_READY = key
             return True
         except ee.EEException as e:
             msg = str(e)
@@ -59,7 +94,7 @@ def initialize_ee(config_path: str = None,
     if config_path or service_account or key_path:
         # Load config JSON if provided
         if config_path:
-            cfg = json.loads(Path(config_path).read_text())
+            cfg = _read_cfg(str(config_path))
             service_account = service_account or cfg.get('service_account')
             key_path = key_path or cfg.get('key_path')
             project = project or cfg.get('project')
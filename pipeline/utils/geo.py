@@ -1 +1,19 @@
-# Stub file
+# pipeline/utils/geo.py
+# ---------------------------------------------------------------------
+"""Vector I/O helpers shared by the pipeline stages."""
+from __future__ import annotations
+
+import importlib.util
+
+import geopandas as gpd
+
+# pyogrio reads straight into NumPy arrays – several times faster than the
+# Fiona engine.  Fall back to geopandas' default when it is not installed.
+_ENGINE = "pyogrio" if importlib.util.find_spec("pyogrio") else None
+
+
+def read_file(path, **kwargs) -> gpd.GeoDataFrame:
+    """gpd.read_file using the pyogrio engine when available."""
+    if _ENGINE and "engine" not in kwargs:
+        kwargs["engine"] = _ENGINE
+    return gpd.read_file(path, **kwargs)
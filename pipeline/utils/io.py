@@ -1 +1,25 @@
-# Stub file
+# pipeline/utils/io.py
+# ---------------------------------------------------------------------
+"""JSON helpers – orjson when installed, stdlib json otherwise."""
+from __future__ import annotations
+
+import json
+
+try:
+    import orjson
+except ImportError:          # optional speed-up
+    orjson = None
+
+
+def json_dumps(obj) -> bytes:
+    """Serialise `obj` to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def json_loads(data: bytes | str):
+    """Parse JSON from bytes or str."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
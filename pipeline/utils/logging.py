@@ -1 +1,33 @@
-# Stub file
+# pipeline/utils/logging.py
+# ---------------------------------------------------------------------
+"""Logging setup shared by the CLI entry points."""
+from __future__ import annotations
+
+import logging
+import logging.handlers
+import os
+
+BUFFER_RECORDS = 100     # records held before one write to stderr
+
+
+def configure_logging(level: str | None = None) -> None:
+    """
+    Configure root logging once.  Level comes from `level`, else the
+    MHP_LOG env var (DEBUG / INFO / WARNING …), default WARNING so batch
+    runs stay quiet.
+
+    Records are buffered and written BUFFER_RECORDS at a time, so a
+    10k-tile run doesn't block on a stream write per message; WARNING and
+    above flush immediately, and the buffer is flushed at exit.
+    """
+    stream = logging.StreamHandler()
+    stream.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    buffered = logging.handlers.MemoryHandler(
+        BUFFER_RECORDS, flushLevel=logging.WARNING, target=stream
+    )
+    logging.basicConfig(
+        level=(level or os.getenv("MHP_LOG", "WARNING")).upper(),
+        handlers=[buffered],
+    )
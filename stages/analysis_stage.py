@@ -21,7 +21,7 @@ from bathymetry import compute_bathymetry, compute_topobathy
 from terrain import compute_slope, compute_bpi
 from wave import compute_wave_layer
 from stacking import stack_layers
-from clustering import run_kmeans
+from clustering import run_kmeans, run_raster
 from export_results import export_results
 
 # Default GEBCO asset if none provided by user
@@ -114,7 +114,11 @@ def run_full_analysis(config_path: Path, gebco_asset: str) -> None:
     # 7. Stack and cluster
     print("🗄️  Stacking layers and running clustering...")
     stack_path = stack_layers([bathy, slope, bpi, wave], config)
-    clusters = run_kmeans(stack_path, config.get("n_clusters", 5), config)
+    if config.get("algorithm", "kmeans") == "raster":
+        clusters = run_raster(stack_path, config.get("raster_precision", 1),
+                              config.get("raster_tau", 5), config)
+    else:
+        clusters = run_kmeans(stack_path, config.get("n_clusters", 5), config)
 
     # 8. Export final clustered map and metrics
     print("📤 Exporting final results...")
@@ -6,17 +6,24 @@ Cloud-workflow stage ❷
 
 • Lists all COGs in gs://<bucket>/clear_water/
 • Downloads anything not already present in ./tiles/
-• Verifies file size & MD5 hash
+• Verifies file size & MD5 hash (inline, while downloading)
 • Optionally deletes the remote copy to keep bucket costs near-zero
 
 Author  : reefmap team — 2025-07-07
 Licence : MIT
 """
 # ──────────────────────────────────────────────────────────
-import argparse, hashlib, os, sys
+import argparse, base64, hashlib, os, sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from google.cloud import storage
+try:                                    # google-cloud-storage ≥ 3
+    from google.cloud.storage.exceptions import DataCorruption
+except ImportError:
+    from google.resumable_media.common import DataCorruption
+
+DL_CONCURRENCY = int(os.getenv("DL_CONCURRENCY", 8))   # parallel downloads
 
 # ──────────────────────────────────────────────────────────
 def parse_cli() -> argparse.Namespace:
@@ -34,12 +41,49 @@ def parse_cli() -> argparse.Namespace:
 
 # ──────────────────────────────────────────────────────────
 def local_md5(path: Path) -> str:
-    """Compute base-16 (hex) MD5 of a local file."""
-    h = hashlib.md5()
+    """
+    MD5 of a local file, base64-encoded – the format of Blob.md5_hash
+    (comparing a hex digest against it never matches).
+    """
     with path.open("rb") as f:
-        for chunk in iter(lambda: f.read(8 << 20), b""):
-            h.update(chunk)
-    return h.hexdigest()
+        if hasattr(hashlib, "file_digest"):          # Python ≥ 3.11
+            h = hashlib.file_digest(f, "md5")
+        else:
+            h = hashlib.md5()
+            for chunk in iter(lambda: f.read(8 << 20), b""):
+                h.update(chunk)
+    return base64.b64encode(h.digest()).decode()
+
+
+# ──────────────────────────────────────────────────────────
+def fetch(blob, dst_dir: Path, purge: bool) -> str:
+    """Download + verify (+ optionally purge) one blob; return a log line."""
+    local_path = dst_dir / Path(blob.name).name
+    lines = []
+
+    # Skip download if file exists and matches – a size mismatch already
+    # proves it differs, so only same-size files need hashing
+    if local_path.exists():
+        if (local_path.stat().st_size == blob.size
+                and local_md5(local_path) == blob.md5_hash):
+            return f"✓  {local_path.name} already present (skipped)"
+        lines.append(f"↻  Re-downloading {local_path.name} (checksum mismatch)")
+
+    # Stream download; the client verifies the MD5 while streaming, so the
+    # file is never read back for a second hashing pass
+    try:
+        with local_path.open("wb") as f:
+            blob.download_to_file(f, checksum="md5")
+    except DataCorruption:
+        raise RuntimeError(f"MD5 mismatch for {local_path.name}")
+    lines.append(f"↓  Downloaded {local_path.name} "
+                 f"({local_path.stat().st_size/1e6:.1f} MB)")
+
+    # Optionally purge from bucket
+    if purge:
+        blob.delete()
+        lines.append(f"🗑️  Purged remote copy of {local_path.name}")
+    return "\n".join(lines)
 
 
 # ──────────────────────────────────────────────────────────
@@ -58,31 +102,19 @@ def main() -> None:
 
     print(f"Found {len(blobs)} COG tiles in gs://{args.bucket}/{args.prefix}\n")
 
-    for blob in blobs:
-        local_path = dst_dir / Path(blob.name).name
-
-        # Skip download if file exists and MD5 matches
-        if local_path.exists():
-            if local_md5(local_path) == blob.md5_hash:
-                print(f"✓  {local_path.name} already present (skipped)")
-                continue
-            else:
-                print(f"↻  Re-downloading {local_path.name} (checksum mismatch)")
-
-        # Stream download
-        with local_path.open("wb") as f:
-            blob.download_to_file(f)
-        print(f"↓  Downloaded {local_path.name} "
-              f"({local_path.stat().st_size/1e6:.1f} MB)")
-
-        # Verify checksum
-        if local_md5(local_path) != blob.md5_hash:
-            sys.exit(f"🛑  MD5 mismatch for {local_path.name}")
-
-        # Optionally purge from bucket
-        if args.purge:
-            blob.delete()
-            print(f"🗑️  Purged remote copy of {local_path.name}")
+    # Downloads are network-bound – keep several streams in flight
+    with ThreadPoolExecutor(max_workers=DL_CONCURRENCY) as ex:
+        futures = [ex.submit(fetch, b, dst_dir, args.purge) for b in blobs]
+        for fut in as_completed(futures):
+            try:
+                print(fut.result())
+            except BaseException as e:
+                # Drop every queued download, whatever the failure (checksum,
+                # network, disk) – only the in-flight ones finish
+                ex.shutdown(wait=False, cancel_futures=True)
+                if isinstance(e, RuntimeError):
+                    sys.exit(f"🛑  {e}")
+                raise
 
     print("\n🏁  All tiles present in", dst_dir.resolve())
 
@@ -18,12 +18,21 @@ Author : reefmap team · 2025-07-07
 Licence: MIT
 """
 # ──────────────────────────────────────────────────────────
-import argparse, json, sys, time
+import argparse, sys, time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import geopandas as gpd
+import numpy as np
 import ee
 
+SUBMIT_WORKERS = 16     # task.start() calls are independent HTTPS requests
+POLL_S         = 30     # seconds between task-status sweeps
+MISSING_ROUNDS = 3      # sweeps a task may be absent before it is given up on
+WAIT_TIMEOUT_S = 12 * 3600
+OK_STATES      = {"COMPLETED", "SUCCEEDED"}
+DONE_STATES    = OK_STATES | {"FAILED", "CANCELLED", "UNKNOWN"}
+
 # ──────────────────────────────────────────────────────────
 def parse_cli() -> argparse.Namespace:
     p = argparse.ArgumentParser(
@@ -40,6 +49,12 @@ def parse_cli() -> argparse.Namespace:
                    help="Cloudy_pixel_percentage threshold")
     p.add_argument("--use_acolite", action="store_true",
                    help="Look for an ACOLITE asset with DSF-corrected scenes")
+    p.add_argument("--wait", action="store_true",
+                   help="Block until every export task has finished")
+    p.add_argument("--wait_timeout", type=float, default=WAIT_TIMEOUT_S,
+                   help="Give up waiting after this many seconds (default 12 h)")
+    p.add_argument("--verbose", action="store_true",
+                   help="Print extra diagnostics (costs extra EE round-trips)")
     return p.parse_args()
 
 
@@ -55,17 +70,22 @@ def init_ee() -> None:
 
 
 # ──────────────────────────────────────────────────────────
-def load_aoi(shp_path: str) -> ee.Geometry:
-    """Read shapefile, dissolve to single polygon, convert to EE geometry."""
-    gdf = gpd.read_file(shp_path).to_crs("EPSG:4326")
-    geojson = json.loads(gdf.unary_union.__geo_interface__)
-    return ee.Geometry(geojson)
+def load_aoi(shp_path: str) -> tuple[ee.Geometry, np.ndarray]:
+    """
+    Read shapefile, dissolve to single polygon, convert to EE geometry.
+    Also returns the AOI bounds in EPSG:3857 so tiling needs no getInfo().
+    """
+    gdf = gpd.read_file(shp_path)
+    bounds_3857 = gdf.to_crs("EPSG:3857").total_bounds
+    geojson = gdf.to_crs("EPSG:4326").unary_union.__geo_interface__
+    return ee.Geometry(geojson), bounds_3857
 
 
 # ──────────────────────────────────────────────────────────
 def build_clear_water(image_collection: ee.ImageCollection,
                       aoi: ee.Geometry,
-                      cloud_pct: int) -> ee.Image:
+                      cloud_pct: int,
+                      verbose: bool = False) -> ee.Image:
     """
     1. Pre-filter: overall CLOUDY_PIXEL_PERCENTAGE (< cloud_pct).
     2. Pixel-level cloud mask from QA60.
@@ -84,60 +104,119 @@ def build_clear_water(image_collection: ee.ImageCollection,
         .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", cloud_pct))
         .map(mask_sentinel2)
     )
-    print("Images after cloud filter:", filtered.size().getInfo())
+    if verbose:   # synchronous getInfo() round-trip – debug only
+        print("Images after cloud filter:", filtered.size().getInfo())
     return filtered.median().clip(aoi)
 
 
 # ──────────────────────────────────────────────────────────
 def export_tiled(image: ee.Image,
-                 aoi: ee.Geometry,
+                 bounds: np.ndarray,
                  bucket: str,
                  tile_size: int,
                  scale: int) -> list[ee.batch.Task]:
     """
-    Split AOI bounding box into square tiles (tile_size metres),
-    start one export task per tile.
+    Split the AOI bounding box (EPSG:3857 metres) into square tiles of
+    tile_size metres and start one export task per tile.
     """
-    # Projected bbox in EPSG:3857
-    bounds = ee.Geometry.BBox(*aoi.bounds().coordinates().getInfo()[0])
-    xmin, ymin, xmax, ymax = bounds.coordinates().flatten()
+    xmin, ymin, xmax, ymax = (float(v) for v in bounds)
+    xs, ys = np.meshgrid(np.arange(xmin, xmax, tile_size),
+                         np.arange(ymin, ymax, tile_size), indexing="ij")
+    x0, y0 = xs.ravel(), ys.ravel()
+    x1 = np.minimum(x0 + tile_size, xmax)
+    y1 = np.minimum(y0 + tile_size, ymax)
 
     tasks = []
-    x = xmin
-    while x < xmax:
-        y = ymin
-        while y < ymax:
-            tile = ee.Geometry.Rectangle(
-                [x, y, min(x + tile_size, xmax), min(y + tile_size, ymax)],
-                proj="EPSG:3857", geodesic=False
-            )
-            name = f"cw_{int(x)}_{int(y)}"
-            task = ee.batch.Export.image.toCloudStorage(
-                image=image,
-                description=name,
-                bucket=bucket,
-                fileNamePrefix=f"clear_water/{name}",
-                region=tile,
-                scale=scale,
-                crs="EPSG:3857",
-                maxPixels=1e13,
-                fileFormat="GeoTIFF",
-                formatOptions={"cloudOptimized": True},
-            )
-            task.start()
-            tasks.append(task)
-            y += tile_size
-        x += tile_size
+    for a, b, c, d in zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist()):
+        name = f"cw_{int(a)}_{int(b)}"
+        tasks.append(ee.batch.Export.image.toCloudStorage(
+            image=image,
+            description=name,
+            bucket=bucket,
+            fileNamePrefix=f"clear_water/{name}",
+            region=ee.Geometry.Rectangle([a, b, c, d],
+                                         proj="EPSG:3857", geodesic=False),
+            scale=scale,
+            crs="EPSG:3857",
+            maxPixels=1e13,
+            fileFormat="GeoTIFF",
+            formatOptions={"cloudOptimized": True},
+        ))
+
+    with ThreadPoolExecutor(max_workers=SUBMIT_WORKERS) as pool:
+        list(pool.map(lambda t: t.start(), tasks))
     print(f"Started {len(tasks)} export tasks.")
     return tasks
 
 
+# ──────────────────────────────────────────────────────────
+def task_states(ids: list[str]) -> dict[str, dict]:
+    """
+    {task_id: {"state", "description", "error"}} for the given export
+    tasks, from a single ee.data.listOperations() sweep of the project's
+    operations (getTaskStatus would issue one RPC per id).  Ids EE does
+    not list are absent from the result.
+    """
+    wanted, out = set(ids), {}
+    for op in ee.data.listOperations():
+        tid = op["name"].rsplit("/", 1)[-1]
+        if tid in wanted:
+            meta = op.get("metadata", {})
+            out[tid] = {
+                "state": meta.get("state", "UNKNOWN"),
+                "description": meta.get("description", tid),
+                "error": op.get("error", {}).get("message"),
+            }
+    return out
+
+
+# ──────────────────────────────────────────────────────────
+def wait_for_tasks(ids: list[str], poll_s: int = POLL_S,
+                   timeout_s: float = WAIT_TIMEOUT_S) -> dict[str, str]:
+    """
+    Poll all export tasks with one listOperations() sweep per round (see
+    task_states) until each reaches a terminal state.  A task EE reports as
+    UNKNOWN, or does not list for MISSING_ROUNDS rounds in a row, is given
+    up on; after timeout_s the remaining tasks are reported as TIMEOUT.
+    Returns {task_id: final_state}.
+    """
+    pending, final = set(ids), {}
+    missing = dict.fromkeys(ids, 0)
+    deadline = time.monotonic() + timeout_s
+    while pending:
+        states = task_states(sorted(pending))
+        for tid in sorted(pending):
+            st = states.get(tid)
+            if st is None:
+                missing[tid] += 1
+                if missing[tid] < MISSING_ROUNDS:
+                    continue
+                st = {"state": "UNKNOWN", "description": tid, "error": None}
+            else:
+                missing[tid] = 0
+            if st["state"] in DONE_STATES:
+                pending.discard(tid)
+                final[tid] = st["state"]
+                mark = "✔" if st["state"] in OK_STATES else "🛑"
+                print(f"{mark}  {st['description']} – {st['state']}"
+                      + (f": {st['error']}" if st["error"] else ""))
+        if not pending:
+            break
+        if time.monotonic() >= deadline:
+            print(f"🛑  Gave up on {len(pending)} task(s) after {timeout_s:.0f} s.")
+            final.update(dict.fromkeys(pending, "TIMEOUT"))
+            break
+        print(f"⏳  {len(pending)} task(s) still running …")
+        time.sleep(poll_s)
+    return final
+
+
 # ──────────────────────────────────────────────────────────
 def main() -> None:
     args = parse_cli()
     init_ee()
 
-    aoi = load_aoi(args.aoi)
+    aoi, bounds = load_aoi(args.aoi)
 
     # Choose collection
     if args.use_acolite:
@@ -155,13 +234,23 @@ def main() -> None:
         )
         print("✔  Using Sentinel-2 SR collection.")
 
-    composite = build_clear_water(s2_coll, aoi, args.cloud_pct)
-    tasks = export_tiled(composite, aoi, args.bucket,
+    composite = build_clear_water(s2_coll, aoi, args.cloud_pct, args.verbose)
+    tasks = export_tiled(composite, bounds, args.bucket,
                          args.tile_size, args.scale)
 
-    # Print EE task URLs for monitoring
-    for t in tasks:
-        print(f"{t.id} – {t.status()['state']}")
+    # Print EE task states for monitoring – one listOperations() sweep
+    ids = [t.id for t in tasks]
+    states = task_states(ids) if ids else {}
+    for tid in ids:
+        print(f"{tid} – {states.get(tid, {}).get('state', 'UNKNOWN')}")
+
+    if args.wait:
+        final = wait_for_tasks(ids, timeout_s=args.wait_timeout)
+        failed = [i for i, state in final.items() if state not in OK_STATES]
+        if failed:
+            sys.exit(f"🛑  {len(failed)} of {len(ids)} export tasks failed.")
+        print("🏁  All export tasks finished.")
+        return
 
     print("\nMonitor tasks in EE Code Editor ➜ Tasks tab. "
           "run_pipeline.py will poll and download once they finish.")
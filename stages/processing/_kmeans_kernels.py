@@ -0,0 +1,121 @@
+"""
+_kmeans_kernels.py
+
+Nearest-centroid assignment for clustering.run_kmeans.  Uses a Numba
+kernel when numba is installed, otherwise a NumPy band-at-a-time loop
+over the same band-major (SoA) layout – neither needs the AoS transpose
+sklearn's predict makes.
+
+For many centres (k > KDTREE_MIN_K) on low-dimensional stacks a k-d tree
+over the centres answers each pixel in ~O(log k) instead of O(k).
+
+Stacks have a small, fixed band count, so a kernel with the band loop
+unrolled is generated and compiled per band count on first use (up to
+MAX_UNROLL bands; wider stacks use the generic kernel).
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:          # optional speed-up
+    HAVE_NUMBA = False
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:          # optional: large-k assignment
+    cKDTree = None
+
+MAX_UNROLL = 16
+KDTREE_MIN_K = 20       # above this many centres, branch-and-bound wins …
+KDTREE_MAX_BANDS = 8    # … as long as the stack stays low-dimensional
+
+# Template for the band-count–specialised kernel: the per-pixel band values
+# are loaded once into scalars and the distance is one unrolled expression,
+# so LLVM can vectorise across pixels.
+_KERNEL_SRC = """
+def _assign_{n}(soa, centers, out):
+    n = soa.shape[1]
+    k = centers.shape[0]
+    for i in prange(n):
+{loads}
+        best = np.inf
+        arg = 0
+        for c in range(k):
+            dist = {sumsq}
+            if dist < best:
+                best = dist
+                arg = c
+        out[i] = arg
+"""
+
+if HAVE_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _assign(soa, centers, out):
+        # soa: (bands, n) – each band is a stride-1 vector
+        n_bands, n = soa.shape
+        k = centers.shape[0]
+        for i in prange(n):
+            best = np.inf
+            arg = 0
+            for c in range(k):
+                d = 0.0
+                for b in range(n_bands):
+                    diff = soa[b, i] - centers[c, b]
+                    d += diff * diff
+                if d < best:
+                    best = d
+                    arg = c
+            out[i] = arg
+
+@lru_cache(maxsize=None)
+def _kernel(n_bands):
+    """Compiled assignment kernel specialised on `n_bands`."""
+    if n_bands > MAX_UNROLL:
+        return _assign
+    src = _KERNEL_SRC.format(
+        n=n_bands,
+        loads="\n".join(f"        x{b} = soa[{b}, i]" for b in range(n_bands)),
+        sumsq=" + ".join(f"(x{b} - centers[c, {b}]) ** 2" for b in range(n_bands)),
+    )
+    namespace = {"np": np, "prange": prange}
+    exec(src, namespace)
+    return njit(parallel=True, fastmath=True)(namespace[f"_assign_{n_bands}"])
+
+def _assign_numpy(soa, centers, out):
+    # one broadcast op per band over stride-1, length-n rows: no AoS copy
+    dists = np.zeros((centers.shape[0], soa.shape[1]), dtype=np.float32)
+    tmp = np.empty_like(dists)
+    for b in range(soa.shape[0]):
+        np.subtract(soa[b:b + 1], centers[:, b:b + 1], out=tmp)
+        tmp *= tmp
+        dists += tmp
+    out[:] = dists.argmin(axis=0)
+
+def assign(soa, centers):
+    """
+    Label of the nearest centre (squared L2) for every pixel.
+
+    Args:
+        soa: (bands, n) pixel array, band-major – i.e. a raster block
+             reshaped with block.reshape(bands, -1), no transpose needed.
+        centers: (k, bands) cluster centres.
+    Returns:
+        (n,) labels – uint8, or uint16 for more than 256 centres.
+    """
+    soa = np.ascontiguousarray(soa, dtype=np.float32)
+    centers = np.ascontiguousarray(centers, dtype=np.float32)
+    out = np.empty(soa.shape[1],
+                   dtype=np.uint8 if len(centers) <= 256 else np.uint16)
+    if (cKDTree is not None and len(centers) > KDTREE_MIN_K
+            and soa.shape[0] <= KDTREE_MAX_BANDS):
+        _, idx = cKDTree(centers).query(soa.T, k=1, workers=-1)
+        out[:] = idx
+    elif HAVE_NUMBA:
+        _kernel(soa.shape[0])(soa, centers, out)
+    else:
+        _assign_numpy(soa, centers, out)
+    return out
@@ -1,33 +1,331 @@
 """
 clustering.py
 
-Performs k-means clustering on stacked layers.
+Performs k-means (or RASTER grid) clustering on stacked layers.
 """
 
-from sklearn.cluster import KMeans
+import hashlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import queue
+import threading
+from pathlib import Path
+
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
 import rasterio
+from rasterio.windows import Window
 import numpy as np
 
+from _kmeans_kernels import assign
+
+FIT_SAMPLES = 500_000   # reservoir size: pixels used to fit the centroids
+BLOCK       = 512       # read / label / write window edge (px)
+PREFETCH    = 4         # windows read ahead by the background reader
+K_CACHE     = (Path(os.getenv("MHP_CACHE_DIR", "~/.mhp_cache")).expanduser()
+               / "kmeans_k.json")                  # sample hash → best k
+K_SWEEP_SUB = 50_000    # pixels (of the reservoir) used for the k sweep
+
+def _windows(rows, cols, size=BLOCK):
+    """Row-major grid of size×size windows covering a rows×cols raster."""
+    for r0 in range(0, rows, size):
+        for c0 in range(0, cols, size):
+            yield Window(c0, r0, min(size, cols - c0), min(size, rows - r0))
+
+def read_windows(path, windows, depth=PREFETCH):
+    """
+    Yield (window, block) for each window of `path`, read by a background
+    thread up to `depth` windows ahead.  GDAL releases the GIL while it
+    reads and decompresses, so the next blocks are decoded while the
+    caller is still labelling / writing the current one.
+    """
+    q = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def reader():
+        try:
+            with rasterio.open(path, sharing=False) as src:
+                for w in windows:
+                    if stop.is_set():
+                        return
+                    q.put((w, src.read(window=w)))
+            q.put(None)
+        except Exception as e:          # re-raised in the consumer
+            q.put(e)
+
+    t = threading.Thread(target=reader, daemon=True)
+    t.start()
+    try:
+        while (item := q.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        while t.is_alive():             # unblock a reader stuck on put()
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                t.join(0.05)
+
+def _reservoir_sample(path, shape, k, rng):
+    """
+    Uniform random sample of k pixels (k × bands, float32) from one pass
+    over the raster's windows – only a few windows are in memory at a time.
+    """
+    bands, rows, cols = shape
+    reservoir = np.empty((k, bands), dtype=np.float32)
+    seen = 0
+    for _, block in read_windows(path, _windows(rows, cols)):
+        px = block.reshape(bands, -1).T
+        # fill the reservoir first …
+        take = min(k - seen, len(px)) if seen < k else 0
+        reservoir[seen:seen + take] = px[:take]
+        rest = px[take:]
+        # … then pixel #g replaces a random slot with probability k / (g+1)
+        g = seen + take + np.arange(len(rest))
+        j = rng.integers(0, g + 1)
+        hit = j < k
+        reservoir[j[hit]] = rest[hit]
+        seen += len(px)
+    return reservoir[:min(seen, k)]
+
+def _gpu_kmeans(n_clusters):
+    """(cupy, cuML KMeans) when a CUDA stack is installed, else (None, None)."""
+    try:
+        import cupy as cp
+        from cuml.cluster import KMeans
+    except ImportError:          # optional CUDA backend
+        return None, None
+    return cp, KMeans(n_clusters=n_clusters, n_init=3, max_iter=100,
+                      random_state=0)
+
+def _k_cache_load():
+    """The k cache, or {} if it is missing, truncated or corrupt."""
+    try:
+        cache = json.loads(K_CACHE.read_text())
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def _k_cache_store(key, k):
+    # Merge into the current file and swap it in atomically, so concurrent
+    # runs never leave a half-written cache behind
+    cache = _k_cache_load()
+    cache[key] = k
+    K_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = K_CACHE.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(cache, indent=2))
+    tmp.replace(K_CACHE)
+
+def _select_k(samples_sub, k0, delta, patience):
+    """
+    Sweep k over [k0-delta, k0+delta] and return the k with the best
+    silhouette score, stopping after `patience` non-improving k in a row.
+    Results are cached in K_CACHE keyed on a hash of the sample, so a
+    re-run over the same stack skips the sweep.
+    """
+    key = "|".join((hashlib.blake2b(samples_sub[:10_000].tobytes()).hexdigest(),
+                    str(k0), str(delta), str(patience), str(len(samples_sub))))
+    cache = _k_cache_load()
+    if key in cache:
+        return cache[key]
+
+    best_k, best, misses = k0, -1.0, 0
+    for k in range(max(2, k0 - delta), k0 + delta + 1):
+        labels = MiniBatchKMeans(n_clusters=k, n_init=3, random_state=0) \
+            .fit_predict(samples_sub)
+        score = silhouette_score(samples_sub, labels, sample_size=5000,
+                                 random_state=0)
+        if score > best:
+            best_k, best, misses = k, score, 0
+        else:
+            misses += 1
+            if misses >= patience:
+                break
+    print(f"🔢 k sweep: best k={best_k} (silhouette {best:.3f})")
+
+    _k_cache_store(key, best_k)
+    return best_k
+
 def run_kmeans(stack_path, n_clusters, config):
     """
     Apply KMeans clustering to a multi-band stack.
+
+    Streams the raster in BLOCK×BLOCK windows (read ahead on a background
+    thread): pass 1 draws a reservoir sample to fit MiniBatchKMeans, pass 2
+    labels each window and writes it to a tiled output – peak memory is
+    O(bands · block · PREFETCH), not the stack.  With config "gpu_kmeans"
+    and cupy + cuML installed, fit and labelling run on the GPU instead.
+    With config "k_delta" > 0, n_clusters is only the centre of a cached
+    silhouette sweep (see _select_k).
+
     Args:
         stack_path: Path to stacked multi-band raster.
         n_clusters: Number of clusters.
-        config: Pipeline configuration dict.
+        config: Pipeline configuration dict (optional "kmeans_batch",
+            "gpu_kmeans", "k_delta", "k_patience").
     Returns:
         Path to clustered output raster.
     """
+    rng = np.random.default_rng(0)
     with rasterio.open(stack_path) as src:
-        stack = src.read()
-        bands, rows, cols = stack.shape
-        samples = stack.reshape(bands, -1).T
-    km = KMeans(n_clusters=n_clusters, random_state=0, n_init="auto")
-    labels = km.fit_predict(samples).astype(np.uint8)
-    clustered = labels.reshape(rows, cols)
+        meta = src.meta.copy()
+    shape = (meta["count"], meta["height"], meta["width"])
+    sample = _reservoir_sample(stack_path, shape, FIT_SAMPLES, rng)
+    if config.get("k_delta", 0) > 0:
+        n_clusters = _select_k(sample[:K_SWEEP_SUB], n_clusters,
+                               config["k_delta"], config.get("k_patience", 2))
+
+    cp, km = _gpu_kmeans(n_clusters) if config.get("gpu_kmeans") else (None, None)
+    if config.get("gpu_kmeans") and km is None:
+        print("⚠  gpu_kmeans set but cupy/cuML not importable – using CPU")
+    if km is None:
+        km = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            batch_size=config.get("kmeans_batch", 65536),
+            n_init=3,
+            max_iter=100,
+            reassignment_ratio=0.01,
+            random_state=0,
+        )
+    out_path = config.get("output_dir", "./outputs") + "/clusters.tif"
+    # labels are 0..k-1: a swept k above 256 must not wrap in uint8
+    label_dtype = np.uint8 if n_clusters <= 256 else np.uint16
+    km.fit(cp.asarray(sample) if cp else sample)
+
+    # GTiff, not COG: the COG driver can't take windowed writes
+    meta.update({
+        "driver": "GTiff", "count": 1, "dtype": np.dtype(label_dtype).name,
+        "tiled": True, "blockxsize": BLOCK, "blockysize": BLOCK,
+        "compress": "ZSTD", "predictor": 2, "zstd_level": 9,
+    })
+    with rasterio.open(out_path, "w", **meta) as dst:
+        for window, block in read_windows(stack_path, _windows(*shape[1:])):
+            soa = block.reshape(shape[0], -1)
+            if cp:                    # one H2D copy in, labels D2H out
+                labels = cp.asnumpy(km.predict(cp.asarray(soa.T)))
+            else:
+                labels = assign(soa, km.cluster_centers_)
+            dst.write(labels.astype(label_dtype).reshape(block.shape[1:]), 1,
+                      window=window)
+    return out_path
+
+
+# ──────────────────────────────────────────────────────────
+# RASTER: grid-projection clustering – O(n), one counting pass
+# ──────────────────────────────────────────────────────────
+_SRC = None     # per-worker dataset handle (see _open_worker)
+_VOID = np.iinfo(np.int64).min  # grid coordinate given to NaN / inf pixels
+
+def _open_worker(path):
+    global _SRC
+    _SRC = rasterio.open(path, sharing=False)
+
+def _cell_keys(block, scale):
+    """Project each pixel onto the grid: one fixed-width void key per pixel."""
+    px = block.reshape(block.shape[0], -1).T * scale
+    bad = ~np.isfinite(px)
+    q = np.floor(np.where(bad, 0, px)).astype(np.int64)
+    q[bad] = _VOID
+    q = np.ascontiguousarray(q)       # .T above is F-ordered: rows must be contiguous
+    return q.view(np.dtype((np.void, q.itemsize * q.shape[1]))).ravel()
+
+def _count_cells(job):
+    window, scale = job
+    keys, counts = np.unique(_cell_keys(_SRC.read(window=window), scale),
+                             return_counts=True)
+    return [k.tobytes() for k in keys], counts.tolist()
+
+def _merge_cells(cells, bands):
+    """
+    Union-find over significant cells: two cells join a cluster if their
+    grid coordinates differ by at most one in every band (the N-d analogue
+    of 8-connectivity).  Returns {cell: label}, labels 1.. by cluster size.
+    """
+    parent = {c: c for c in cells}
+
+    def find(c):
+        while parent[c] != c:
+            parent[c] = parent[parent[c]]
+            c = parent[c]
+        return c
+
+    offsets = [np.array(o, dtype=np.int64)
+               for o in itertools.product((-1, 0, 1), repeat=bands) if any(o)]
+    for c in cells:
+        coord = np.frombuffer(c, dtype=np.int64)
+        for o in offsets:
+            n = (coord + o).tobytes()
+            if n in parent:
+                a, b = find(c), find(n)
+                if a != b:
+                    parent[b] = a
+
+    members = {}
+    for c in cells:
+        members.setdefault(find(c), []).append(c)
+    ranked = sorted(members.values(),
+                    key=lambda m: -sum(cells[c] for c in m))
+    return {c: label for label, m in enumerate(ranked, 1) for c in m}
+
+def run_raster(stack_path, precision, tau, config):
+    """
+    RASTER clustering of a multi-band stack (linear time, no fitting).
+
+    Each pixel is truncated to `precision` decimal places per band, giving
+    a grid cell.  Pass 1 counts cells per window in a process pool; cells
+    seen at least `tau` times are kept and merged with their neighbours
+    into clusters.  Pass 2 labels each window – pixels in sparse cells get
+    label 0.  Memory is bounded by the number of distinct cells.
+
+    Args:
+        stack_path: Path to stacked multi-band raster.
+        precision: Decimal places kept per band (grid cell = 10**-precision).
+        tau: Minimum pixel count for a cell to be significant.
+        config: Pipeline configuration dict (optional "raster_workers").
+    Returns:
+        Path to clustered output raster.
+    """
+    scale = 10.0 ** precision
     out_path = config.get("output_dir", "./outputs") + "/clusters.tif"
-    meta = src.meta.copy()
-    meta.update({"count": 1, "dtype": "uint8"})
+
+    with rasterio.open(stack_path) as src:
+        meta = src.meta.copy()
+    bands, rows, cols = meta["count"], meta["height"], meta["width"]
+
+    counts = {}
+    jobs = ((w, scale) for w in _windows(rows, cols))
+    # spawn, not fork: forking after numba / GDAL / reader threads have
+    # started can deadlock the children on an inherited lock
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(config.get("raster_workers"), initializer=_open_worker,
+                  initargs=(stack_path,)) as pool:
+        for keys, n in pool.imap_unordered(_count_cells, jobs, chunksize=4):
+            for k, c in zip(keys, n):
+                counts[k] = counts.get(k, 0) + c
+
+    labels = _merge_cells({k: c for k, c in counts.items()
+                           if c >= tau and _VOID not in np.frombuffer(k, np.int64)},
+                          bands)
+    del counts
+    n_clusters = len(set(labels.values()))
+    print(f"🧮 RASTER: {len(labels)} significant cells → {n_clusters} clusters")
+    dtype = np.uint8 if n_clusters < 256 else np.uint16
+
+    meta.update({
+        "driver": "GTiff", "count": 1, "dtype": np.dtype(dtype).name,
+        "nodata": 0,
+        "tiled": True, "blockxsize": BLOCK, "blockysize": BLOCK,
+        "compress": "ZSTD", "predictor": 2, "zstd_level": 9,
+    })
     with rasterio.open(out_path, "w", **meta) as dst:
-        dst.write(clustered, 1)
+        for window, block in read_windows(stack_path, _windows(rows, cols)):
+            keys, inv = np.unique(_cell_keys(block, scale), return_inverse=True)
+            lut = np.fromiter((labels.get(k.tobytes(), 0) for k in keys),
+                              dtype=dtype, count=len(keys))
+            dst.write(lut[inv.ravel()].reshape(block.shape[1:]), 1,
+                      window=window)
     return out_path
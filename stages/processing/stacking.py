@@ -4,17 +4,33 @@ stacking.py
 Stacks multiple raster layers into a single multi-band image.
 """
 
-import rasterio
-from rasterio.merge import merge
+import os
+
+from osgeo import gdal
+
+gdal.UseExceptions()
 
 def stack_layers(layer_paths, config):
     """
     Stack list of single-band rasters into a multi-band raster.
+
+    Builds a VRT (one band per layer, highest input resolution, bilinear
+    resampling) rather than copying pixels: readers such as rasterio pull
+    windows straight from the source rasters, so no intermediate stack is
+    written to disk.
+
     Args:
         layer_paths: List of file paths to rasters.
         config: Pipeline configuration dict.
     Returns:
-        Path to stacked multi-band raster.
+        Path to stacked multi-band raster (.vrt).
     """
-    # TODO: Use rasterio.open and write multi-band COG
-    raise NotImplementedError("stack_layers not implemented")
+    out_dir = config.get("output_dir", "./outputs")
+    os.makedirs(out_dir, exist_ok=True)
+    vrt_path = out_dir + "/stack.vrt"
+    vrt = gdal.BuildVRT(vrt_path, [str(p) for p in layer_paths],
+                        separate=True, resolution="highest",
+                        resampleAlg="bilinear")
+    vrt.FlushCache()
+    vrt = None          # close → VRT XML written
+    return vrt_path
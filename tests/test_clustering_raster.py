@@ -0,0 +1,42 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("sklearn")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "stages" / "processing"))
+from clustering import run_raster  # noqa: E402
+
+
+def _write_stack(path, data):
+    bands, rows, cols = data.shape
+    with rasterio.open(path, "w", driver="GTiff", width=cols, height=rows,
+                       count=bands, dtype="float32") as dst:
+        dst.write(data)
+
+
+@pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+def test_run_raster_two_blobs(tmp_path):
+    # 4-band stack: left half ~0.2, right half ~0.8, one NaN pixel
+    rng = np.random.default_rng(0)
+    data = np.empty((4, 64, 64), dtype=np.float32)
+    data[:, :, :32] = 0.2
+    data[:, :, 32:] = 0.8
+    data += rng.uniform(0, 0.04, data.shape).astype(np.float32)
+    data[:, 0, 0] = np.nan
+    stack = tmp_path / "stack.tif"
+    _write_stack(stack, data)
+
+    out = run_raster(str(stack), precision=1, tau=5,
+                     config={"output_dir": str(tmp_path), "raster_workers": 2})
+
+    with rasterio.open(out) as src:
+        labels = src.read(1)
+    assert labels.shape == (64, 64)
+    assert labels[0, 0] == 0                       # NaN → unlabelled
+    left, right = labels[1:, :32], labels[:, 32:]
+    assert len(np.unique(left)) == 1 and len(np.unique(right)) == 1
+    assert left[0, 0] != right[0, 0] and 0 not in (left[0, 0], right[0, 0])